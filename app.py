@@ -1,13 +1,31 @@
 import os
 import json
-import google.auth
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from fastapi import FastAPI, Request, HTTPException, Depends, Header, Form
+import uuid
+from typing import List, Optional
+from fastapi import FastAPI, Request, HTTPException, Depends, Header, Form, File, UploadFile
+from firebase_admin import firestore
+from pydantic import BaseModel
 from starlette.responses import RedirectResponse
-from features import *
-from vector_rag import *
+from sse_starlette.sse import EventSourceResponse
+from features import (
+    app, LIFESPAN_HOOKS, get_db, verify_firebase_token, chatbot_response, chatbot_response_stream, summarizebot,
+    plan_event, prioritize_task, prioritize_tasks,
+)
+from llm_gateway import run_blocking
+from ingestion_jobs import submit_job
+from calendar_provider import get_calendar
+from vector_rag import generate_rag_answer, stream_rag_answer
+from vector_store import get_vector_store
+from context_builder import context_stats
+from llm_cache import llm_cache
+from semantic_cache import semantic_cache
+from embedding_cache import embedding_cache
+from firestore_lists import list_collection_page
+from list_cache import list_cache
+from write_buffer import WriteBehindBuffer
+from bulk_writes import bulk_add, BULK_MAX_ITEMS, BULK_LLM_CONCURRENCY
+from event_extraction import extraction_stats_snapshot
+from priority_classifier import priority_stats_snapshot
 
 # Request model / schema for summarization post request
 class SummarizeRequest(BaseModel):
@@ -17,6 +35,10 @@ class SummarizeRequest(BaseModel):
 class AvailabilityRequest(BaseModel):
     user_input: str
     
+class BulkRequest(BaseModel):
+    user_id: str
+    messages: List[str]  # one task / text to summarize / reminder per entry, at most BULK_MAX_ITEMS
+
 class ChatRequest(BaseModel):
     user_id: str
     message: str
@@ -24,6 +46,24 @@ class ChatRequest(BaseModel):
 class QueryRequest(BaseModel):
     user_id: str
     query: str
+    mode: Optional[str] = None  # "vector", "lexical" or "hybrid", defaults to RETRIEVAL_MODE
+
+# Chat logs are written behind the response, in batches (see write_buffer.py)
+# The list cache is invalidated once the batch is committed, so a page of GET /chats cached while a chat was still queued is dropped once it lands
+chat_log = WriteBehindBuffer(get_db, on_commit=lambda collection, data: list_cache.invalidate(collection, data["user_id"]))
+
+async def flush_chat_log():
+    await run_blocking(chat_log.stop)
+
+LIFESPAN_HOOKS.append((chat_log.start, flush_chat_log))
+
+def add_user_document(collection, data):
+    """
+    Add one document and drop the user's cached list pages. Blocking, the routes call it through run_blocking.
+    """
+    doc_ref = get_db().collection(collection).add(data)
+    list_cache.invalidate(collection, data["user_id"])
+    return doc_ref[1].id
     
 @app.post("/query_rag")
 async def query_rag(request: QueryRequest):
@@ -31,12 +71,28 @@ async def query_rag(request: QueryRequest):
     Retrieve relevant info using RAG based on user's query.
     """
     try:
-        response = generate_rag_answer(request.query, request.user_id)
+        response = await generate_rag_answer(request.query, request.user_id, request.mode)
         return {"user_id": request.user_id, "query": request.query, "response": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/query_rag_stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Same as /query_rag but streams the answer as server-sent events ("token" events, then a "done" event).
+    """
+    async def event_stream():
+        try:
+            async for token in stream_rag_answer(request.query, request.user_id, request.mode):
+                yield {"event": "token", "data": token}
+            yield {"event": "done", "data": json.dumps({"user_id": request.user_id, "query": request.query})}
+        except Exception as e:
+            yield {"event": "error", "data": str(e)}
+
+    return EventSourceResponse(event_stream())
+
+
 # later problem ngl
 
 
@@ -51,18 +107,21 @@ if not os.path.exists(UPLOAD_FOLDER):
 @app.post("/upload_pdf")
 async def upload_pdf(file: UploadFile = File(...), user_id: str = Form(...)):
     """
-    Uploads a PDF and processes it into the vector database.
+    Uploads a PDF and queues it for processing into the vector database.
+    Poll /jobs/{job_id} for progress.
     """
     try:
-        # Save the uploaded file
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
+        # Save the uploaded file under a per-request name, so two uploads of the same file name can't overwrite each other
+        # before the worker reads them; the ingestion worker deletes it when it's done
+        file_name = os.path.basename(file.filename or "upload.pdf")
+        file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{file_name}")
         with open(file_path, "wb") as buffer:
             buffer.write(await file.read())
 
-        # Process the PDF and add it to Pinecone under the user's ID
-        add_new_pdf(file_path, user_id)
+        # Queue the PDF to be added to Pinecone under the user's ID
+        job_id = submit_job(file_path, user_id, file_name=file_name, delete_file=True)
 
-        return {"message": "File uploaded and processed successfully", "file_name": file.filename, "user_id": user_id}
+        return {"message": "File uploaded and queued for processing", "file_name": file_name, "user_id": user_id, "job_id": job_id, "status": "queued"}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -73,40 +132,56 @@ async def upload_pdf(file: UploadFile = File(...), user_id: str = Form(...)):
 async def chat(request: ChatRequest):
     """
     Store chat messages in Firestore.
+    The write is queued in the write-behind buffer, so the response doesn't wait for Firestore.
     """
     
-    bot = chatbot_response(request.message)
+    bot = await chatbot_response(request.message)
     try:
-        chat_ref = db.collection("chats").add({
+        message_id = chat_log.add("chats", {
             "user_id": request.user_id,
             "user_message": request.message,
             "bot_response": bot,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
 
-        return {"message_id": chat_ref[1].id, "bot_response": bot}
+        return {"message_id": message_id, "bot_response": bot}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/chat_stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Same as /chat but streams the bot response as server-sent events.
+    The chat is queued for Firestore once the stream finishes and its id is sent in the final "done" event.
+    """
+    async def event_stream():
+        tokens = []
+        try:
+            async for token in chatbot_response_stream(request.message):
+                tokens.append(token)
+                yield {"event": "token", "data": token}
+
+            bot = "".join(tokens)
+            message_id = chat_log.add("chats", {
+                "user_id": request.user_id,
+                "user_message": request.message,
+                "bot_response": bot,
+                "timestamp": firestore.SERVER_TIMESTAMP
+            })
+            yield {"event": "done", "data": json.dumps({"message_id": message_id, "bot_response": bot})}
+        except Exception as e:
+            yield {"event": "error", "data": str(e)}
+
+    return EventSourceResponse(event_stream())
+
 @app.get("/chats/{user_id}")
-async def get_chats(user_id: str):
+async def get_chats(user_id: str, limit: Optional[int] = None, start_after: Optional[str] = None, select: Optional[str] = None, format: str = "json"):
     """
-    Fetch all chat messages for a user.
+    Fetch chat messages for a user.
+    Paginated newest first, see firestore_lists.py for limit / start_after / select / format.
     """
-    try:
-        chats = db.collection("chats").where("user_id", "==", user_id).order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
-        return [
-            {
-                "message_id": chat.id,
-                "user_message": chat.to_dict().get("user_message"),
-                "bot_response": chat.to_dict().get("bot_response"),
-                "timestamp": chat.to_dict().get("timestamp")
-            }
-            for chat in chats
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await list_collection_page(get_db, "chats", user_id, limit, start_after, select, format)
 
 
 def get_current_user(authorization: str = Header(None)):
@@ -134,44 +209,43 @@ async def summarize(request: SummarizeRequest):
     Summarize text and save it to Firestore (No authentication required).
     """
     try:
-        summary = summarizebot(request.message)
+        summary = await summarizebot(request.message)
 
-        note_ref = db.collection("summaries").add({
+        note_id = await run_blocking(add_user_document, "summaries", {
             "user_id": request.user_id,  # ✅ Directly use user_id from request
             "original_text": request.message,
             "summary": summary,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
 
-        return {"summary": summary, "note_id": note_ref[1].id}
+        return {"summary": summary, "note_id": note_id}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/summarize/bulk")
+async def summarize_bulk(request: BulkRequest):
+    """
+    Summarize many texts at once. LLM calls run concurrently, results are saved with batched writes.
+    Returns one result per text, in order, with either the summary and note_id or an error.
+    """
+    check_bulk_size(request)
+
+    async def build(message):
+        return {"original_text": message, "summary": await summarizebot(message)}
+
+    return await bulk_add(get_db(), "summaries", request.user_id, request.messages, build, "note_id")
+
 # API endpoint to retrieve summaries for a specific user
 
 @app.get("/summaries/{user_id}")
-async def get_summaries(user_id: str):
+async def get_summaries(user_id: str, limit: Optional[int] = None, start_after: Optional[str] = None, select: Optional[str] = None, format: str = "json"):
     """
-    Fetch all summaries for a specific user (No authentication required).
+    Fetch summaries for a specific user (No authentication required).
+    Paginated newest first, see firestore_lists.py for limit / start_after / select / format.
     """
-    try:
-        summaries = db.collection("summaries").where("user_id", "==", user_id).order_by(
-            "timestamp", direction=firestore.Query.DESCENDING
-        ).stream()
-
-        return [
-            {
-                "note_id": summary.id,
-                "original_text": summary.to_dict().get("original_text"),
-                "summary": summary.to_dict().get("summary"),
-                "timestamp": summary.to_dict().get("timestamp"),
-            }
-            for summary in summaries
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await list_collection_page(get_db, "summaries", user_id, limit, start_after, select, format)
 
 
 @app.get("/debug_user")
@@ -185,64 +259,13 @@ async def checkAvailability(request: AvailabilityRequest):
     Extract event details, find available time slots, and store in Firestore.
     """
     try:
-        # Extract event details using AI
-        res = co.chat(
-            model="command-r-plus",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""
-                    Extract scheduling details and return a JSON object:
-                    {{
-                        "task_name": "<Task Name>",
-                        "duration_hours": <Duration in hours (positive number)>,
-                        "week_start": "<YYYY-MM-DD>",
-                        "week_end": "<YYYY-MM-DD>"
-                    }}
-
-                    Respond with ONLY the JSON object. No explanations, formatting, or extra text.
-                    If extraction fails, return: {{}}.
-
-                    Text: {request.user_input}
-                    """
-                }
-            ],
-        )
-
-        response_text = res.message.content[0].text if res.message.content else ""
-        response_text = response_text.strip("```json").strip("```").strip()
-
-        # Parse the AI response into event_data
-        try:
-            event_data = json.loads(response_text)
-            if not event_data.get("task_name") or not event_data.get("duration_hours"):
-                raise ValueError("Missing required fields in AI response.")
-        except (json.JSONDecodeError, ValueError):
-            raise HTTPException(status_code=500, detail="AI returned invalid JSON.")
-
-        print("✅ Extracted Event Data:", json.dumps(event_data, indent=2))
-
-        # Step 2: Fetch unavailable times
-        logic_apps_url = "https://prod-21.northcentralus.logic.azure.com:443/workflows/e1d025b460494c53862f958fe67c0be9/triggers/When_a_HTTP_request_is_received/paths/invoke?api-version=2016-10-01&sp=%2Ftriggers%2FWhen_a_HTTP_request_is_received%2Frun&sv=1.0&sig=3FElBEyk25j3s6YLw3L2nw45EjCugN7May7ixC6NUWc"
-        response = requests.post(logic_apps_url, json=event_data)
-
-        try:
-            unavailable_times = response.json()
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Logic Apps returned invalid JSON.")
-
-        print("📅 Unavailable Times:", json.dumps(unavailable_times, indent=2))
-
-        # Step 3: Compute available slots
-        available_slots = get_available_slots(unavailable_times, event_data["duration_hours"])
-        print("✅ Computed Available Slots:", json.dumps(available_slots, indent=2))
-
-        # Step 4: Select the best time
-        selected_time = provideDates(event_data, available_slots)
+        # Steps 1-4: extract the event, fetch busy times, compute slots and select the best time
+        event_user_id = "test_user"  # Replace with authenticated user ID if using auth
+        event_data, available_slots, selected_time = await plan_event(request.user_input, event_user_id)
 
         # Step 5: Store event details in Firestore
-        event_ref = db.collection("events").add({
-            "user_id": "test_user",  # Replace with authenticated user ID if using auth
+        event_id = await run_blocking(add_user_document, "events", {
+            "user_id": event_user_id,
             "task_name": event_data["task_name"],
             "duration_hours": event_data["duration_hours"],
             "week_start": event_data["week_start"],
@@ -253,7 +276,7 @@ async def checkAvailability(request: AvailabilityRequest):
         })
 
         return {
-            "event_id": event_ref[1].id,
+            "event_id": event_id,
             "task_name": event_data["task_name"],
             "available_times": available_slots["available_times"],
             "selected_time": selected_time.get("selected_time", None)
@@ -264,89 +287,164 @@ async def checkAvailability(request: AvailabilityRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/events/{user_id}")
-async def get_events(user_id: str):
+async def get_events(user_id: str, limit: Optional[int] = None, start_after: Optional[str] = None, select: Optional[str] = None, format: str = "json"):
     """
-    Fetch all events scheduled for a user from Firestore.
+    Fetch events scheduled for a user from Firestore.
+    Paginated newest first, see firestore_lists.py for limit / start_after / select / format.
     """
-    try:
-        events_ref = db.collection("events").where("user_id", "==", user_id).order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
-
-        return [
-            {
-                "event_id": event.id,
-                "task_name": event.to_dict().get("task_name"),
-                "duration_hours": event.to_dict().get("duration_hours"),
-                "week_start": event.to_dict().get("week_start"),
-                "week_end": event.to_dict().get("week_end"),
-                "selected_time": event.to_dict().get("selected_time"),
-                "available_slots": event.to_dict().get("available_slots"),
-                "timestamp": event.to_dict().get("timestamp")
-            }
-            for event in events_ref
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await list_collection_page(get_db, "events", user_id, limit, start_after, select, format)
 
 
 
 @app.post("/add_task")
 async def add_task(request: SummarizeRequest):
-    priority = prioritize_task(request.message)
+    try:
+        priority = await prioritize_task(request.message)
 
-    task_ref = db.collection("tasks").add({
-        "user_id": request.user_id,
-        "task": request.message,
-        "priority": priority,
-        "timestamp": firestore.SERVER_TIMESTAMP
-    })
+        task_id = await run_blocking(add_user_document, "tasks", {
+            "user_id": request.user_id,
+            "task": request.message,
+            "priority": priority,
+            "timestamp": firestore.SERVER_TIMESTAMP
+        })
 
-    return {"task": request.message, "priority": priority, "task_id": task_ref[1].id}
+        return {"task": request.message, "priority": priority, "task_id": task_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tasks/{user_id}")
-async def get_tasks(user_id: str):
+async def get_tasks(user_id: str, limit: Optional[int] = None, start_after: Optional[str] = None, select: Optional[str] = None, format: str = "json"):
+    """
+    Fetch a user's tasks and their priorities.
+    Paginated newest first, see firestore_lists.py for limit / start_after / select / format.
+    """
+    return await list_collection_page(get_db, "tasks", user_id, limit, start_after, select, format)
+
+
+@app.post("/add_reminder")
+async def add_reminder(request: SummarizeRequest):
     try:
-        tasks = db.collection("tasks").where("user_id", "==", user_id).order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
-
-        return [
-            {
-                "task_id": task.id,
-                "task": task.to_dict().get("task"),
-                "priority": task.to_dict().get("priority"),
-                "timestamp": task.to_dict().get("timestamp")
-            }
-            for task in tasks
-        ]
+        reminder_id = await run_blocking(add_user_document, "reminders", {
+            "user_id": request.user_id,
+            "reminder_text": request.message,
+            "repeat": "weekly",  # Options: daily, weekly, monthly
+            "timestamp": firestore.SERVER_TIMESTAMP
+        })
+
+        return {"reminder_text": request.message, "repeat": "weekly", "reminder_id": reminder_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/add_task/bulk")
+async def add_tasks_bulk(request: BulkRequest):
+    """
+    Add many tasks at once, e.g. a semester import. The tasks are prioritized in one batch (the model only sees the
+    ambiguous ones) and saved with batched writes.
+    """
+    check_bulk_size(request)
+    priorities = await prioritize_tasks(request.messages, max_concurrency=BULK_LLM_CONCURRENCY)
 
-@app.post("/add_reminder")
-async def add_reminder(request: SummarizeRequest):
-    note_ref = db.collection("reminders").add({
-        "user_id": request.user_id,
-        "reminder_text": request.message,
-        "repeat": "weekly",  # Options: daily, weekly, monthly
-        "timestamp": firestore.SERVER_TIMESTAMP
-    })
+    async def build(item):
+        message, priority = item
+        if isinstance(priority, Exception):
+            raise priority
+        return {"task": message, "priority": priority}
+
+    return await bulk_add(get_db(), "tasks", request.user_id, list(zip(request.messages, priorities)), build, "task_id")
+
+@app.post("/add_reminder/bulk")
+async def add_reminders_bulk(request: BulkRequest):
+    """
+    Add many weekly reminders at once with batched writes.
+    """
+    check_bulk_size(request)
 
-    return {"reminder_text": request.message, "repeat": "weekly", "reminder_id": note_ref[1].id}
+    async def build(message):
+        return {"reminder_text": message, "repeat": "weekly"}
+
+    return await bulk_add(get_db(), "reminders", request.user_id, request.messages, build, "reminder_id")
+
+def check_bulk_size(request: BulkRequest):
+    if not 1 <= len(request.messages) <= BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"messages must hold between 1 and {BULK_MAX_ITEMS} entries")
 
 @app.get("/reminders/{user_id}")
-async def get_reminders(user_id: str):
-    try:
-        reminders = db.collection("reminders").where("user_id", "==", user_id).order_by("timestamp", direction=firestore.Query.DESCENDING).stream()
-
-        return [
-            {
-                "reminder_id": reminder.id,
-                "reminder_text": reminder.to_dict().get("reminder_text"),
-                "repeat": reminder.to_dict().get("repeat"),
-                "timestamp": reminder.to_dict().get("timestamp")
-            }
-            for reminder in reminders
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def get_reminders(user_id: str, limit: Optional[int] = None, start_after: Optional[str] = None, select: Optional[str] = None, format: str = "json"):
+    """
+    Fetch a user's reminders.
+    Paginated newest first, see firestore_lists.py for limit / start_after / select / format.
+    """
+    return await list_collection_page(get_db, "reminders", user_id, limit, start_after, select, format)
+
+@app.get("/llm_cache/stats")
+async def llm_cache_stats():
+    """
+    Hit/miss counters for the LLM response cache.
+    """
+    return llm_cache.stats()
+
+@app.get("/semantic_cache/stats")
+async def semantic_cache_stats():
+    """
+    Hit/miss counters for the per-user semantic answer cache in front of the RAG routes.
+    """
+    return semantic_cache.stats()
+
+@app.get("/embedding_cache/stats")
+async def embedding_cache_stats():
+    """
+    Hit/miss counters for the chunk embedding cache, and how many identical uploads were skipped.
+    """
+    return embedding_cache.stats()
+
+@app.get("/list_cache/stats")
+async def list_cache_stats():
+    """
+    Hit/miss counters (overall and per collection) for the cache in front of the history list routes.
+    """
+    return list_cache.stats()
+
+@app.get("/write_buffer/stats")
+async def write_buffer_stats():
+    """
+    Queue depth and flush latency of the write-behind buffer for chat logs.
+    """
+    return chat_log.stats()
+
+@app.get("/vector_store/stats")
+async def vector_store_stats():
+    """
+    Backend in use and index handle pool statistics (size, hit rate, evictions).
+    """
+    return get_vector_store().stats()
+
+@app.get("/calendar/stats")
+async def calendar_stats():
+    """
+    Busy-time cache hit rate and the average time a calendar fetch takes.
+    """
+    return get_calendar().stats()
+
+@app.get("/extraction/stats")
+async def extraction_stats():
+    """
+    How many scheduling requests the rule-based extractor answered, and how many went to the model.
+    """
+    return extraction_stats_snapshot()
+
+@app.get("/priority/stats")
+async def priority_stats():
+    """
+    How many tasks the local classifier prioritized, how many went to the model, and the label counts.
+    """
+    return priority_stats_snapshot()
+
+@app.get("/rag/context_stats")
+async def rag_context_stats():
+    """
+    Running totals of prompt tokens before/after context packing, and how many were saved.
+    """
+    return context_stats
 
 @app.get("/test_firestore")
 async def test_firestore():
@@ -354,8 +452,7 @@ async def test_firestore():
     Test Firestore connection by retrieving all documents from the 'chats' collection.
     """
     try:
-        chats_ref = db.collection("chats").limit(1).stream()
-        result = [doc.to_dict() for doc in chats_ref]
+        result = await run_blocking(lambda: [doc.to_dict() for doc in get_db().collection("chats").limit(1).stream()])
         return {"status": "success", "data": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
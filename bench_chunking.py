@@ -0,0 +1,109 @@
+import argparse
+import glob
+import json
+import os
+from chunking import split_pages
+from context_builder import count_tokens
+from embedding_engine import IngestionEngine
+from fake_backends import FakeEmbeddings, FakeVectorIndex
+from pdf_extraction import extract_serial
+
+'''
+
+BENCHMARK: chunking strategies, cost vs. retrieval quality
+
+Chunks the PDFs in test_documents/ with each strategy, embeds them into one index (like a student's corpus) and reports
+chunk count, embedding tokens, index size and recall@k over the labelled questions in test_documents/questions.json.
+A question counts as recalled at k when one of the top k chunks from its document contains the whole answer text.
+By default the local fake backends are used, so this is free and offline; the fake embeddings are bag-of-words, so compare
+strategies with each other rather than reading the recall as what ada-002 would get. --openai uses the real embedding API.
+Tokens are counted like context_builder.py does (tiktoken, or ~4 chars per token when it can't load).
+
+    python bench_chunking.py
+    python bench_chunking.py --configs recursive:1000:500 recursive:1000:100 sentence:800:150 --k 1 3 5
+
+'''
+
+# strategy:chunk_size:chunk_overlap, sizes are tokens for "token" and characters otherwise
+DEFAULT_CONFIGS = [
+    "recursive:1000:500",
+    "recursive:1000:200",
+    "recursive:1000:0",
+    "page:1000:200",
+    "sentence:1000:200",
+    "token:256:64",
+]
+VECTOR_BYTES = 1536 * 4  # one float32 ada-002 vector
+
+
+def normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def load_pages(paths):
+    # Same page texts as vector_rag.iter_pdf_pages
+    return {os.path.basename(path): [text + "\n" for text in extract_serial(path)] for path in paths}
+
+
+def run_config(config, documents, questions, ks, embedder):
+    strategy, chunk_size, chunk_overlap = config.split(":")
+    records = []
+    for name, pages in documents.items():
+        for i, (text, metadata) in enumerate(split_pages(pages, strategy, int(chunk_size), int(chunk_overlap))):
+            records.append((f"{name}:{i}", text, {**metadata, "document": name}))
+
+    index = FakeVectorIndex(call_latency=0)
+    IngestionEngine(embedder.embed_documents, index.upsert).run(records)
+
+    hits = {k: 0 for k in ks}
+    for question in questions:
+        matches = index.query(embedder.embed_query(question["question"]), top_k=max(ks))["matches"]
+        answer = normalize(question["answer"])
+        found = [
+            match["metadata"]["document"] == question["document"] and answer in normalize(match["metadata"]["text"])
+            for match in matches
+        ]
+        for k in ks:
+            hits[k] += any(found[:k])
+
+    metadata_bytes = sum(len(json.dumps(metadata)) + len(text.encode("utf-8")) for _, text, metadata in records)
+    return {
+        "chunks": len(records),
+        "tokens": sum(count_tokens(text) for _, text, _ in records),
+        "index_mb": (len(records) * VECTOR_BYTES + metadata_bytes) / 1e6,
+        "recall": {k: hits[k] / len(questions) for k in ks},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", default=sorted(glob.glob(os.path.join("test_documents", "*.pdf"))))
+    parser.add_argument("--questions", default=os.path.join("test_documents", "questions.json"))
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--openai", action="store_true", help="embed with text-embedding-ada-002 instead of the fake backend")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as questions_file:
+        questions = json.load(questions_file)
+    documents = load_pages(args.paths)
+
+    if args.openai:
+        from langchain_openai import OpenAIEmbeddings
+
+        embedder = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-ada-002")
+    else:
+        embedder = FakeEmbeddings(dimension=1536, call_latency=0, per_text_latency=0)
+
+    print(f"{len(documents)} documents, {len(questions)} questions")
+    recall_header = "".join(f"{f'recall@{k}':>11}" for k in args.k)
+    print(f"{'strategy:size:overlap':<24}{'chunks':>8}{'tokens':>9}{'index MB':>10}{recall_header}")
+
+    for config in args.configs:
+        result = run_config(config, documents, questions, args.k, embedder)
+        recall = "".join(f"{result['recall'][k]:>11.2f}" for k in args.k)
+        print(f"{config:<24}{result['chunks']:>8}{result['tokens']:>9}{result['index_mb']:>10.2f}{recall}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from event_extraction import extract_event, EXTRACTION_MIN_CONFIDENCE
+
+'''
+
+BENCHMARK: rule-based scheduling-detail extraction vs. the LLM
+
+Runs the requests in test_documents/scheduling_requests.json through the rule-based extractor, with "today" fixed to
+the corpus's "now" so the relative dates have one right answer, and reports:
+hit rate   share of requests answered without the model (confidence >= --min-confidence)
+accuracy   share of those answers where all four fields match the label ("expected": null means the model should get it,
+           so answering it at all counts as wrong)
+latency    per request
+--llm also runs every request through the command-r-plus extraction of features.py (needs the app's environment and
+costs one Cohere call per request) for the same accuracy and latency numbers. The model doesn't know the corpus's "now",
+so only compare its task names and durations when the corpus date is not today.
+
+    python bench_extraction.py
+    python bench_extraction.py --min-confidence 0.9 --show-misses
+    python bench_extraction.py --llm
+
+'''
+
+
+def matches(event_data, expected, check_dates=True):
+    if expected is None:
+        return False
+    fields = ("task_name", "duration_hours", "week_start", "week_end") if check_dates else ("task_name", "duration_hours")
+    for field in fields:
+        got, want = event_data.get(field), expected[field]
+        if field == "task_name":
+            got, want = str(got or "").strip().lower(), want.lower()
+        elif field == "duration_hours":
+            got = round(float(got or 0), 2)
+        if got != want:
+            return False
+    return True
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def run_rules(requests, now, min_confidence, show_misses):
+    hits, correct, latencies = 0, 0, []
+    for request in requests:
+        start = time.perf_counter()
+        event_data, confidence = extract_event(request["text"], now)
+        latencies.append(time.perf_counter() - start)
+        if confidence < min_confidence:
+            if show_misses and request["expected"] is not None:
+                print(f"  model  ({confidence:.2f}) {request['text']!r} -> {event_data}")
+            continue
+        hits += 1
+        if matches(event_data, request["expected"]):
+            correct += 1
+        elif show_misses:
+            print(f"  wrong  ({confidence:.2f}) {request['text']!r} -> {event_data}, expected {request['expected']}")
+    return hits, correct, latencies
+
+
+async def run_llm(requests):
+    # Imported here, features.py needs the app's credentials
+    import features
+    # Every request goes to the model, whatever the rules would have done
+    features.EXTRACTION_MIN_CONFIDENCE = 2.0
+
+    correct, latencies = 0, []
+    for request in requests:
+        start = time.perf_counter()
+        try:
+            event_data = await features.extract_event_details(request["text"], use_cache=False)
+        except Exception:
+            event_data = {}
+        latencies.append(time.perf_counter() - start)
+        correct += matches(event_data, request["expected"], check_dates=False)
+    return correct, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="test_documents/scheduling_requests.json")
+    parser.add_argument("--min-confidence", type=float, default=EXTRACTION_MIN_CONFIDENCE)
+    parser.add_argument("--show-misses", action="store_true")
+    parser.add_argument("--llm", action="store_true", help="also time the command-r-plus extraction (real API calls)")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    requests = corpus["requests"]
+    now = datetime.fromisoformat(corpus["now"])
+    labelled = sum(request["expected"] is not None for request in requests)
+
+    hits, correct, latencies = run_rules(requests, now, args.min_confidence, args.show_misses)
+    print(f"{len(requests)} requests ({labelled} the rules should answer), min confidence {args.min_confidence}")
+    print(f"{'path':>8}{'hit rate':>10}{'accuracy':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    print(
+        f"{'rules':>8}{hits / len(requests):>10.1%}{(correct / hits if hits else 0):>10.1%}"
+        f"{percentile(latencies, 0.5) * 1000:>10.3f}{percentile(latencies, 0.95) * 1000:>10.3f}"
+    )
+
+    if args.llm:
+        llm_correct, llm_latencies = asyncio.run(run_llm(requests))
+        print(
+            f"{'llm':>8}{1:>10.1%}{llm_correct / labelled:>10.1%}"
+            f"{percentile(llm_latencies, 0.5) * 1000:>10.1f}{percentile(llm_latencies, 0.95) * 1000:>10.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
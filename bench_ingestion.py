@@ -0,0 +1,74 @@
+import argparse
+import itertools
+from embedding_engine import IngestionEngine, IngestionError
+from fake_backends import FakeEmbeddings, FakeVectorIndex
+
+'''
+
+BENCHMARK: embedding + upsert throughput
+
+Drives IngestionEngine against the fake embedding and vector backends and reports chunks/sec for each combination
+of embedding batch size and worker counts. Latencies default to rough numbers for the OpenAI embeddings API and a
+Pinecone upsert; --failure-rate shows the cost of per-batch retries.
+
+    python bench_ingestion.py
+    python bench_ingestion.py --chunks 5000 --embed-batch-sizes 32 128 --upsert-workers 1 8 --failure-rate 0.05
+
+'''
+
+
+def synthetic_chunks(count, size=1000):
+    words = "eigenvalue matrix variance regression gradient integral vector probability theorem lemma".split()
+    for i in range(count):
+        text = " ".join(words[(i + j) % len(words)] for j in range(size // 8))
+        yield f"chunk {i}: {text}"[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--embed-batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--embed-workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--upsert-batch-size", type=int, default=100)
+    parser.add_argument("--upsert-workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--embed-per-text-latency", type=float, default=0.0005, help="extra seconds per text in a request")
+    parser.add_argument("--upsert-latency", type=float, default=0.02, help="seconds per upsert request")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{args.chunks} chunks, upsert batch {args.upsert_batch_size}, failure rate {args.failure_rate}")
+    print(f"{'embed batch':>12}{'embed workers':>15}{'upsert workers':>16}{'seconds':>10}{'chunks/s':>10}{'retries':>9}{'failed':>8}")
+
+    for embed_batch_size, embed_workers, upsert_workers in itertools.product(
+        args.embed_batch_sizes, args.embed_workers, args.upsert_workers
+    ):
+        embedder = FakeEmbeddings(
+            dimension=64,
+            call_latency=args.embed_latency,
+            per_text_latency=args.embed_per_text_latency,
+            failure_rate=args.failure_rate,
+        )
+        index = FakeVectorIndex(call_latency=args.upsert_latency, failure_rate=args.failure_rate)
+        engine = IngestionEngine(
+            embedder.embed_documents,
+            index.upsert,
+            embed_batch_size=embed_batch_size,
+            embed_workers=embed_workers,
+            upsert_batch_size=args.upsert_batch_size,
+            upsert_workers=upsert_workers,
+            retry_backoff=0.01,
+        )
+        try:
+            stats = engine.run(synthetic_chunks(args.chunks))
+        except IngestionError as e:
+            stats = e.stats
+
+        print(
+            f"{embed_batch_size:>12}{embed_workers:>15}{upsert_workers:>16}{stats['seconds']:>10.2f}"
+            f"{stats['chunks_per_sec']:>10.0f}{stats['retries']:>9}{len(stats['failed_batches']):>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import glob
+import os
+import time
+from pdf_extraction import extract_parallel, extract_serial, new_pool, page_count, EXTRACT_PROCESSES, PAGES_PER_RANGE
+
+'''
+
+BENCHMARK: serial page loop vs. parallel page-range extraction
+
+Runs both engines over the PDFs in test_documents/ (or the paths given) and checks they produce identical text.
+The test PDFs are short, so --repeat extracts each document several times to get stable numbers.
+
+    python bench_pdf_extraction.py
+    python bench_pdf_extraction.py big_course_pack.pdf --processes 8 --pages-per-range 8
+
+'''
+
+
+def time_engine(run, repeat):
+    best = float("inf")
+    pages = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages = list(run())
+        best = min(best, time.perf_counter() - start)
+    return best, pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", default=sorted(glob.glob(os.path.join("test_documents", "*.pdf"))))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=EXTRACT_PROCESSES)
+    parser.add_argument("--pages-per-range", type=int, default=PAGES_PER_RANGE)
+    args = parser.parse_args()
+
+    print(f"processes={args.processes} pages_per_range={args.pages_per_range} repeat={args.repeat} (best of)")
+    print(f"{'document':<32}{'pages':>7}{'serial s':>11}{'parallel s':>12}{'speedup':>9}")
+
+    with new_pool(args.processes) as pool:
+        # Warm the pool so process start-up isn't charged to the first document
+        list(pool.map(abs, range(args.processes)))
+
+        for path in args.paths:
+            total_pages = page_count(path)
+            serial_time, serial_pages = time_engine(lambda: extract_serial(path), args.repeat)
+            parallel_time, parallel_pages = time_engine(
+                lambda: extract_parallel(
+                    path,
+                    total_pages,
+                    pages_per_range=args.pages_per_range,
+                    max_in_flight=2 * args.processes,
+                    pool=pool,
+                ),
+                args.repeat,
+            )
+            assert serial_pages == parallel_pages, f"{path}: parallel output differs from serial output"
+
+            speedup = serial_time / parallel_time if parallel_time else float("inf")
+            print(f"{os.path.basename(path):<32}{total_pages:>7}{serial_time:>11.4f}{parallel_time:>12.4f}{speedup:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
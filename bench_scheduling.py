@@ -0,0 +1,59 @@
+import argparse
+import time
+from calendar_provider import CachedCalendar, LocalCalendarProvider, LOCAL_CALENDAR_FILE
+from scheduling import get_available_slots
+
+'''
+
+BENCHMARK: busy times + slot search
+
+Runs the scheduling path of /checkAvailability without the model or the Logic App: busy events come from the local
+calendar file (file.json by default, the Logic App's format) with a fixed delay standing in for the Logic App round trip.
+Reports requests/sec and latency with and without the per-user busy-time cache, for a number of users asking about
+the same week again and again.
+
+    python bench_scheduling.py
+    python bench_scheduling.py --requests 2000 --users 50 --latency 0.3 --week-start 2025-02-03 --week-end 2025-02-09
+
+'''
+
+
+def run(calendar, requests, users, week_start, week_end, duration_hours):
+    event_data = {"task_name": "study", "duration_hours": duration_hours, "week_start": week_start, "week_end": week_end}
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        request_start = time.perf_counter()
+        busy = calendar.busy_times(f"user-{i % users}", event_data)
+        get_available_slots(busy, duration_hours, week_start, week_end)
+        latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calendar", default=LOCAL_CALENDAR_FILE)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per calendar fetch, stands in for the Logic App")
+    parser.add_argument("--duration-hours", type=float, default=2)
+    parser.add_argument("--week-start", default=None)
+    parser.add_argument("--week-end", default=None)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests from {args.users} users, {args.latency * 1000:.0f} ms per calendar fetch")
+    print(f"{'cache':>8}{'seconds':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'fetches':>9}")
+    for ttl in (0, 60):
+        provider = LocalCalendarProvider(args.calendar, latency=args.latency)
+        calendar = CachedCalendar(provider, ttl_seconds=ttl)
+        elapsed, latencies = run(calendar, args.requests, args.users, args.week_start, args.week_end, args.duration_hours)
+        print(
+            f"{'on' if ttl else 'off':>8}{elapsed:>10.2f}{args.requests / elapsed:>10.1f}"
+            f"{latencies[len(latencies) // 2] * 1000:>10.2f}{latencies[int(len(latencies) * 0.95)] * 1000:>10.2f}{provider.calls:>9}"
+        )
+
+
+if __name__ == '__main__':
+    main()
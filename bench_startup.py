@@ -0,0 +1,95 @@
+import argparse
+import json
+import subprocess
+import sys
+
+'''
+
+BENCHMARK: cold start
+
+Starts a fresh Python process per run (so nothing is cached in sys.modules) and reports, in milliseconds:
+import     time to import the app module (app.py by default, --module features for the API without the chat routes)
+startup    time for the lifespan startup hooks (ingestion workers, chat log buffer, optional client preload)
+first      latency of the first request to each --path, which pays for any client built lazily on the way
+second     latency of the same request again, for comparison
+--top lists the slowest module imports of one extra run, from python -X importtime.
+Requests go through Starlette's TestClient, in process, so no network or uvicorn is involved.
+
+    python bench_startup.py
+    python bench_startup.py --module features --paths / /llm_cache/stats --runs 5 --top 15
+
+'''
+
+_CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+result = {"import": (imported - start) * 1000, "requests": {}}
+client = TestClient(module.app)
+start = time.perf_counter()
+client.__enter__()
+result["startup"] = (time.perf_counter() - start) * 1000
+for path in sys.argv[2:]:
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        status = client.get(path).status_code
+        timings.append((time.perf_counter() - start) * 1000)
+    result["requests"][path] = {"status": status, "first": timings[0], "second": timings[1]}
+client.__exit__(None, None, None)
+print(json.dumps(result))
+"""
+
+
+def run_once(module, paths):
+    completed = subprocess.run([sys.executable, "-c", _CHILD, module, *paths], capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self [us] | cumulative | imported package"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--paths", nargs="+", default=["/"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports (cumulative)")
+    args = parser.parse_args()
+
+    results = [run_once(args.module, args.paths) for _ in range(args.runs)]
+    print(f"{args.module}: median of {args.runs} cold starts, ms")
+    print(f"{'import':>20}  {median([r['import'] for r in results]):>8.0f}")
+    print(f"{'startup':>20}  {median([r['startup'] for r in results]):>8.0f}")
+    for path in args.paths:
+        first = median([r["requests"][path]["first"] for r in results])
+        second = median([r["requests"][path]["second"] for r in results])
+        status = results[-1]["requests"][path]["status"]
+        print(f"{path:>20}  first {first:>8.1f}  second {second:>8.1f}  (HTTP {status})")
+
+    if args.top:
+        print(f"slowest imports of {args.module}, cumulative ms")
+        for cumulative_us, name in slowest_imports(args.module, args.top):
+            print(f"{cumulative_us / 1000:>10.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
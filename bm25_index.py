@@ -0,0 +1,196 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from vector_store import HandlePool, file_lock, index_path
+
+load_dotenv()
+
+'''
+
+BM25 LEXICAL INDEX
+
+A per-user inverted index over the same chunks (and chunk ids) that go into the vector store, kept on local disk.
+Exact course codes, textbook titles and formula names match here even when the embedding doesn't, and a lexical
+search needs no call to the embedding provider at all.
+'def add_chunks' / 'def delete_chunks' / 'def clear' keep it in step with the vector store during ingestion and deletes
+'def search' returns BM25 matches in the same {"id", "score", "metadata"} shape as vector_store queries
+'def reciprocal_rank_fusion' merges ranked lists from both retrievers for hybrid mode
+
+'''
+
+BM25_DIR = os.getenv("BM25_DIR", "bm25_data")
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Keeps "2072u", "stat-2010", "x_i" and "3.14" as single tokens, which is what course codes and formulas look like
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-_][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class _LexicalIndex:
+    """
+    docs.jsonl is append-only: {"id", "text", "metadata"} adds or replaces a chunk, {"id", "deleted": true} removes it.
+    The postings live in memory; our own appends are applied to them directly, and they are only rebuilt from the file
+    when another process has changed it. Writes hold an exclusive flock on <index>.lock, searches a shared one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = os.path.join(path, "docs.jsonl")
+        self.lock_path = path.rstrip(os.sep) + ".lock"
+        with _path_locks_guard:
+            self._lock = _path_locks.setdefault(path, threading.RLock())
+        self._signature = None
+        self.docs = {}          # id -> (metadata incl. text, term counts, length)
+        self.postings = {}      # term -> {id: term frequency}
+        self.total_length = 0
+        self.lines = 0
+
+    def _file_signature(self):
+        return (os.path.getsize(self._file), os.path.getmtime(self._file)) if os.path.exists(self._file) else None
+
+    def _reload_if_changed(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self.docs, self.postings, self.total_length, self.lines = {}, {}, 0, 0
+        if signature is None:
+            return
+        with open(self._file, encoding="utf-8") as docs_file:
+            for line in docs_file:
+                self._apply(json.loads(line))
+                self.lines += 1
+
+    def _apply(self, entry):
+        self._remove(entry["id"])
+        if entry.get("deleted"):
+            return
+        counts = Counter(tokenize(entry["text"]))
+        length = sum(counts.values())
+        self.docs[entry["id"]] = ({**entry.get("metadata", {}), "text": entry["text"]}, counts, length)
+        self.total_length += length
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[entry["id"]] = frequency
+
+    def _remove(self, doc_id):
+        existing = self.docs.pop(doc_id, None)
+        if existing is None:
+            return
+        _, counts, length = existing
+        self.total_length -= length
+        for term in counts:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def _append(self, entries):
+        # Called with the exclusive file lock held, after a reload, so the file is exactly what is in memory
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file, "a", encoding="utf-8") as docs_file:
+            for entry in entries:
+                docs_file.write(json.dumps(entry) + "\n")
+        # Applied in memory, rebuilding every posting from the file after each batch made ingestion quadratic
+        for entry in entries:
+            self._apply(entry)
+        self.lines += len(entries)
+        self._signature = self._file_signature()
+        if self.lines > 2 * max(len(self.docs), 1000):
+            self._compact()
+
+    def _compact(self):
+        tmp_file = self._file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as docs_file:
+            for doc_id, (metadata, _, _) in self.docs.items():
+                metadata = dict(metadata)
+                text = metadata.pop("text")
+                docs_file.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n")
+        os.replace(tmp_file, self._file)
+        self.lines = len(self.docs)
+        self._signature = self._file_signature()
+
+    def add(self, records):
+        with self._lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            self._append([{"id": doc_id, "text": text, "metadata": metadata} for doc_id, text, metadata in records])
+
+    def delete(self, ids):
+        with self._lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            self._append([{"id": doc_id, "deleted": True} for doc_id in ids])
+
+    def clear(self):
+        with self._lock, file_lock(self.lock_path):
+            if os.path.exists(self._file):
+                os.remove(self._file)
+            self._signature = "cleared"
+            self._reload_if_changed()
+
+    def search(self, query, k):
+        with self._lock, file_lock(self.lock_path, shared=True):
+            self._reload_if_changed()
+            doc_count = len(self.docs)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self.docs[doc_id][2]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    )
+            top = sorted(scores.items(), key=lambda item: -item[1])[:k]
+            return [{"id": doc_id, "score": score, "metadata": dict(self.docs[doc_id][0])} for doc_id, score in top]
+
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+# index_path encodes the user id, so no id can step out of BM25_DIR
+_indexes = HandlePool(lambda index_name: _LexicalIndex(index_path(BM25_DIR, index_name)))
+
+
+def add_chunks(index_name, records):
+    """
+    records are (id, text, metadata); an existing id is replaced.
+    """
+    if records:
+        _indexes.get(index_name).add(records)
+
+
+def delete_chunks(index_name, ids):
+    if ids:
+        _indexes.get(index_name).delete(ids)
+
+
+def clear(index_name):
+    _indexes.get(index_name).clear()
+
+
+def search(index_name, query, k):
+    return _indexes.get(index_name).search(query, k)
+
+
+def reciprocal_rank_fusion(*ranked_lists, k=RRF_K):
+    """
+    Merge match lists (best first) by summing 1 / (k + rank); a chunk found by both retrievers rises to the top.
+    """
+    fused = {}
+    for matches in ranked_lists:
+        for rank, match in enumerate(matches):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match["metadata"]})
+            entry["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda match: -match["score"])
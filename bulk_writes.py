@@ -0,0 +1,67 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from firebase_admin import firestore
+from llm_gateway import run_blocking
+from list_cache import list_cache
+from write_buffer import commit_in_batches
+
+load_dotenv()
+
+'''
+
+BULK CREATE
+
+Shared by the /add_task/bulk, /summarize/bulk and /add_reminder/bulk routes.
+'def bulk_add' builds every item's document (running its LLM call, BULK_LLM_CONCURRENCY at a time), writes the
+successful ones with Firestore batched writes and returns one result per item, in order: the document or the error.
+One bad item never fails the others.
+
+'''
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+# On top of the gateway's per-provider limit, so one import can't take every Cohere slot from interactive users
+BULK_LLM_CONCURRENCY = int(os.getenv("BULK_LLM_CONCURRENCY", "8"))
+
+
+async def bulk_add(db, collection, user_id, messages, build, id_field):
+    """
+    build(message) is async and returns the document's fields (without user_id / timestamp).
+    """
+    limit = asyncio.Semaphore(BULK_LLM_CONCURRENCY)
+
+    async def build_one(message):
+        async with limit:
+            return await build(message)
+
+    built = await asyncio.gather(*(build_one(message) for message in messages), return_exceptions=True)
+
+    results = [None] * len(messages)
+    records, positions = [], []
+    for index, fields in enumerate(built):
+        if isinstance(fields, Exception):
+            results[index] = {"index": index, "error": _error_message(fields)}
+            continue
+        records.append({"user_id": user_id, **fields, "timestamp": firestore.SERVER_TIMESTAMP})
+        positions.append(index)
+
+    doc_ids = await run_blocking(commit_in_batches, db, collection, records)
+    for index, record, doc_id in zip(positions, records, doc_ids):
+        if isinstance(doc_id, Exception):
+            results[index] = {"index": index, "error": _error_message(doc_id)}
+        else:
+            fields = {key: value for key, value in record.items() if key not in ("user_id", "timestamp")}
+            results[index] = {"index": index, id_field: doc_id, **fields}
+
+    if any(id_field in result for result in results):
+        list_cache.invalidate(collection, user_id)
+    return {
+        "created": sum(id_field in result for result in results),
+        "failed": sum("error" in result for result in results),
+        "results": results,
+    }
+
+
+def _error_message(error):
+    # The LLM helpers raise HTTPException, its message is in .detail
+    return str(getattr(error, "detail", error))
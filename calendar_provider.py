@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+CALENDAR BUSY-TIME PROVIDERS
+
+The scheduling routes get the user's busy events only through this module, in the Logic App's format:
+{"events": [{"Start": iso, "End": iso, ...}, ...]}
+'class LogicAppsProvider' posts the event details to the Azure Logic App (Outlook calendar) over one pooled requests.Session,
+so the TLS connection is reused, with a connect and a read timeout so a hung Logic App can't hang the worker
+'class LocalCalendarProvider' reads the events from a JSON file (LOCAL_CALENDAR_FILE, same format), for offline runs and benchmarks
+'class CachedCalendar' keeps each user's busy events per week range for CALENDAR_CACHE_TTL_SECONDS in front of either one
+'def get_calendar' picks the provider from the CALENDAR_PROVIDER env variable ("logic_apps" or "local")
+
+'''
+
+CALENDAR_PROVIDER = os.getenv("CALENDAR_PROVIDER", "logic_apps")
+LOGIC_APPS_URL = os.getenv(
+    "LOGIC_APPS_URL",
+    "https://prod-21.northcentralus.logic.azure.com:443/workflows/e1d025b460494c53862f958fe67c0be9/triggers/When_a_HTTP_request_is_received/paths/invoke?api-version=2016-10-01&sp=%2Ftriggers%2FWhen_a_HTTP_request_is_received%2Frun&sv=1.0&sig=3FElBEyk25j3s6YLw3L2nw45EjCugN7May7ixC6NUWc",
+)
+CALENDAR_CONNECT_TIMEOUT_SECONDS = float(os.getenv("CALENDAR_CONNECT_TIMEOUT_SECONDS", "5"))
+CALENDAR_READ_TIMEOUT_SECONDS = float(os.getenv("CALENDAR_READ_TIMEOUT_SECONDS", "20"))
+CALENDAR_POOL_SIZE = int(os.getenv("CALENDAR_POOL_SIZE", "16"))
+# Short, a meeting added in Outlook shows up within this long
+CALENDAR_CACHE_TTL_SECONDS = float(os.getenv("CALENDAR_CACHE_TTL_SECONDS", "60"))
+CALENDAR_CACHE_MAX_ENTRIES = int(os.getenv("CALENDAR_CACHE_MAX_ENTRIES", "1024"))
+LOCAL_CALENDAR_FILE = os.getenv("LOCAL_CALENDAR_FILE", "file.json")
+
+
+class CalendarError(Exception):
+    pass
+
+
+class LogicAppsProvider:
+    def __init__(self, url=LOGIC_APPS_URL, connect_timeout=CALENDAR_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout=CALENDAR_READ_TIMEOUT_SECONDS, pool_size=CALENDAR_POOL_SIZE):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        # requests.Session is safe to share between the gateway's threads for plain posts like this one
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def busy_times(self, user_id, event_data):
+        try:
+            response = self.session.post(self.url, json=event_data, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.Timeout:
+            raise CalendarError(f"Logic Apps did not answer within {self.timeout[1]} seconds.")
+        except json.JSONDecodeError:
+            # Before RequestException, requests' own JSONDecodeError is both
+            raise CalendarError("Logic Apps returned invalid JSON.")
+        except requests.RequestException as e:
+            raise CalendarError(f"Logic Apps request failed: {str(e)}")
+
+    def close(self):
+        self.session.close()
+
+
+class LocalCalendarProvider:
+    """
+    The file holds either one calendar for everyone, {"events": [...]}, or one per user, {user_id: {"events": [...]}}.
+    It is re-read when it changes. 'latency' adds a fixed delay per call to mimic the Logic App in benchmarks.
+    """
+
+    def __init__(self, path=LOCAL_CALENDAR_FILE, latency=0.0):
+        self.path = path
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._loaded = None  # (mtime, data)
+        self.calls = 0
+
+    def _data(self):
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._loaded is None or self._loaded[0] != mtime:
+                with open(self.path, encoding="utf-8") as f:
+                    self._loaded = (mtime, json.load(f))
+            return self._loaded[1]
+
+    def busy_times(self, user_id, event_data):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            data = self._data()
+        except (OSError, json.JSONDecodeError) as e:
+            raise CalendarError(f"Could not read the local calendar {self.path}: {str(e)}")
+        calendar = data if "events" in data else data.get(user_id) or {"events": []}
+        return {"events": calendar.get("events") or []}
+
+    def close(self):
+        pass
+
+
+class CachedCalendar:
+    """
+    TTL + LRU cache of busy events keyed by (user_id, week_start, week_end).
+    Concurrent misses for the same key are not merged, both calls go to the provider and the last one is kept.
+    """
+
+    def __init__(self, provider, ttl_seconds=CALENDAR_CACHE_TTL_SECONDS, max_entries=CALENDAR_CACHE_MAX_ENTRIES):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, busy_times)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fetch_seconds_total = 0.0
+
+    def busy_times(self, user_id, event_data):
+        key = (user_id, event_data.get("week_start"), event_data.get("week_end"))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        start = time.perf_counter()
+        busy_times = self.provider.busy_times(user_id, event_data)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.fetch_seconds_total += elapsed
+            self._entries[key] = (time.time() + self.ttl_seconds, busy_times)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return busy_times
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def close(self):
+        self.provider.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "provider": type(self.provider).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_fetch_seconds": self.fetch_seconds_total / self.misses if self.misses else 0.0,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar():
+    global _calendar
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                provider = LocalCalendarProvider() if CALENDAR_PROVIDER == "local" else LogicAppsProvider()
+                _calendar = CachedCalendar(provider)
+    return _calendar
@@ -0,0 +1,172 @@
+import os
+import re
+from dotenv import load_dotenv
+from context_builder import count_tokens
+
+load_dotenv()
+
+'''
+
+CHUNKING STRATEGIES
+
+Turns a stream of page texts into (chunk, {"page": n}) pairs for write_pinecone_index. Every strategy streams, so a
+big PDF is never held in memory, and every chunk is tagged with the page it starts on.
+"recursive"  the original splitter: CHUNK_SIZE characters with CHUNK_OVERLAP overlap, chunks may run across pages
+"page"       the same splitter run on each page on its own, so no chunk ever straddles a page break
+"sentence"   packs whole sentences up to CHUNK_SIZE characters, starts a new chunk at every section heading, and
+             overlaps by whole sentences instead of cutting words in half
+"token"      the recursive splitter with lengths measured in tokens (CHUNK_TOKENS / CHUNK_TOKEN_OVERLAP), which is what
+             the embedding API bills for
+'def split_pages' picks the strategy (CHUNK_STRATEGY by default), bench_chunking.py compares them.
+LangChain's splitter is imported on the first split, not when the API starts.
+
+'''
+
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "recursive")
+CHUNK_STRATEGIES = ("recursive", "page", "sentence", "token")
+# (the bigger the chunk_size, the context can get lost, overlap between chunks can help context)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "500"))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "64"))
+SPLIT_WINDOW_CHARS = int(os.getenv("SPLIT_WINDOW_CHARS", "20000"))
+
+# "3. Course Description", "2.1 Grading" or an all-caps line such as "FACULTY OF SCIENCE"
+_HEADING_PATTERN = re.compile(r"^(\d+(\.\d+)*\.?\s+[A-Z][^.?!]*|[A-Z][A-Z&/,\-]+(\s+[A-Z][A-Z0-9&/,\-]*)+)$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+MAX_HEADING_CHARS = 80
+
+
+def split_pages(pages, strategy=None, chunk_size=None, chunk_overlap=None):
+    """
+    pages is an iterable of page texts. chunk_size / chunk_overlap are in tokens for the "token" strategy, characters otherwise.
+    """
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {CHUNK_STRATEGIES}")
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if strategy == "token":
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or CHUNK_TOKENS,
+            chunk_overlap=CHUNK_TOKEN_OVERLAP if chunk_overlap is None else chunk_overlap,
+            length_function=count_tokens,
+        )
+        return _split_windowed(pages, splitter)
+
+    chunk_size = chunk_size or CHUNK_SIZE
+    chunk_overlap = CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    if strategy == "sentence":
+        return _split_sentences(pages, chunk_size, chunk_overlap)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if strategy == "page":
+        return _split_each_page(pages, splitter)
+    return _split_windowed(pages, splitter)
+
+
+def _split_windowed(pages, splitter):
+    # Split once the window is full, but hold back the last chunk so it can merge with the next page's text
+    # page_starts holds (offset in buffer, page number) so every chunk can be tagged with the page it starts on
+    buffer = ""
+    page_starts = []
+    for page_number, page_text in enumerate(pages, start=1):
+        page_starts.append((len(buffer), page_number))
+        buffer += page_text
+        if len(buffer) < SPLIT_WINDOW_CHARS:
+            continue
+        chunks = _locate_chunks(buffer, splitter.split_text(buffer), page_starts)
+        yield from ((text, {"page": page}) for text, _, page in chunks[:-1])
+        if chunks:
+            text, offset, page = chunks[-1]
+            buffer = text
+            page_starts = [(0, page)] + [(start - offset, number) for start, number in page_starts if start > offset]
+        else:
+            buffer, page_starts = "", []
+
+    if buffer.strip():
+        yield from ((text, {"page": page}) for text, _, page in _locate_chunks(buffer, splitter.split_text(buffer), page_starts))
+
+
+def _locate_chunks(buffer, chunks, page_starts):
+    # The splitter only returns text, so find each chunk in the buffer (in order, they overlap) to recover its page
+    located = []
+    cursor = 0
+    for text in chunks:
+        offset = buffer.find(text, cursor)
+        if offset == -1:
+            offset = cursor
+        page = next((number for start, number in reversed(page_starts) if start <= offset), page_starts[0][1] if page_starts else None)
+        located.append((text, offset, page))
+        cursor = offset + 1
+    return located
+
+
+def _split_each_page(pages, splitter):
+    for page_number, page_text in enumerate(pages, start=1):
+        for text in splitter.split_text(page_text):
+            yield text, {"page": page_number}
+
+
+def _split_sentences(pages, chunk_size, chunk_overlap):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Sentences longer than a whole chunk are cut with the character splitter, without overlap
+    fallback = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    current = []  # (sentence, page)
+    length = 0
+
+    def flush(keep_overlap):
+        text = " ".join(sentence for sentence, _ in current)
+        chunk = (text, {"page": current[0][1]})
+        carried = []
+        if keep_overlap:
+            # Carry whole trailing sentences that fit in the overlap into the next chunk
+            carried_length = 0
+            for sentence, page in reversed(current[1:]):
+                if carried_length + len(sentence) + 1 > chunk_overlap:
+                    break
+                carried.insert(0, (sentence, page))
+                carried_length += len(sentence) + 1
+        return chunk, carried
+
+    for page_number, page_text in enumerate(pages, start=1):
+        for unit, is_heading in _sentence_units(page_text):
+            pieces = [unit] if len(unit) <= chunk_size else fallback.split_text(unit)
+            for piece in pieces:
+                # A heading always opens a new chunk, and the previous section isn't carried over into it
+                if current and (is_heading or length + len(piece) + 1 > chunk_size):
+                    chunk, current = flush(keep_overlap=not is_heading)
+                    yield chunk
+                    length = sum(len(sentence) + 1 for sentence, _ in current)
+                    # The carried overlap gives way when the next sentence wouldn't fit next to it
+                    while current and length + len(piece) + 1 > chunk_size:
+                        length -= len(current.pop(0)[0]) + 1
+                current.append((piece, page_number))
+                length += len(piece) + 1
+
+    if current:
+        yield flush(keep_overlap=False)[0]
+
+
+def _sentence_units(page_text):
+    # Yields (text, is_heading): headings on their own, everything else cut into sentences
+    paragraph = []
+    for line in page_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) <= MAX_HEADING_CHARS and _HEADING_PATTERN.match(line):
+            yield from _sentences(" ".join(paragraph))
+            paragraph = []
+            yield line, True
+        else:
+            paragraph.append(line)
+    yield from _sentences(" ".join(paragraph))
+
+
+def _sentences(text):
+    for sentence in _SENTENCE_END.split(text):
+        if sentence.strip():
+            yield sentence.strip(), False
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+RAG CONTEXT BUILDER
+
+Turns the retrieved chunks into the context block of the RAG prompt using as few tokens as possible.
+With 1000-char chunks and 500-char overlap, neighbouring hits repeat half of each other's text, so:
+'def build_context' drops exact duplicates and chunks contained in another, stitches chunks whose end overlaps the next
+one's start (or that are consecutive chunks of the same document), optionally re-ranks with maximal marginal relevance,
+then packs passages in relevance order until the token budget is spent.
+It returns the context text plus a report of how many tokens it saved compared to the raw chunks.
+
+'''
+
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+RAG_CONTEXT_MMR = os.getenv("RAG_CONTEXT_MMR", "false").lower() == "true"
+RAG_CONTEXT_MMR_LAMBDA = float(os.getenv("RAG_CONTEXT_MMR_LAMBDA", "0.7"))
+MIN_OVERLAP_CHARS = 50
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+
+_encoding = None
+_encoding_loaded = False
+
+context_stats = {"prompts": 0, "tokens_before": 0, "tokens_after": 0, "tokens_saved": 0}
+_stats_lock = threading.Lock()
+
+
+def _get_encoding():
+    # Loaded on first use, the BPE file may have to be downloaded
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o-mini's tokenizer
+        except Exception:
+            # tiktoken missing, or no network to fetch the BPE file: fall back to the usual ~4 chars per token estimate
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def build_context(retrieved_chunks, token_budget=RAG_CONTEXT_TOKEN_BUDGET, use_mmr=RAG_CONTEXT_MMR, mmr_lambda=RAG_CONTEXT_MMR_LAMBDA):
+    """
+    retrieved_chunks are LangChain Documents (or plain strings), most relevant first.
+    Returns (context_text, report).
+    """
+    passages = [_passage(chunk, rank) for rank, chunk in enumerate(retrieved_chunks)]
+    raw_tokens = count_tokens(PASSAGE_SEPARATOR.join(passage["text"] for passage in passages))
+
+    passages = _dedupe(passages)
+    passages = _merge_overlaps(passages)
+    passages.sort(key=lambda passage: passage["rank"])
+    if use_mmr:
+        passages = _mmr(passages, mmr_lambda)
+
+    packed = []
+    used_tokens = 0
+    for passage in passages:
+        separator_tokens = count_tokens(PASSAGE_SEPARATOR) if packed else 0
+        remaining = token_budget - used_tokens - separator_tokens
+        if remaining <= 0:
+            break
+        tokens = count_tokens(passage["text"])
+        text = passage["text"] if tokens <= remaining else truncate_to_tokens(passage["text"], remaining)
+        packed.append(text)
+        used_tokens += separator_tokens + min(tokens, remaining)
+
+    context = PASSAGE_SEPARATOR.join(packed)
+    report = {
+        "chunks_in": len(retrieved_chunks),
+        "passages_out": len(packed),
+        "tokens_before": raw_tokens,
+        "tokens_after": count_tokens(context),
+    }
+    report["tokens_saved"] = max(report["tokens_before"] - report["tokens_after"], 0)
+
+    with _stats_lock:
+        context_stats["prompts"] += 1
+        for field in ("tokens_before", "tokens_after", "tokens_saved"):
+            context_stats[field] += report[field]
+    return context, report
+
+
+def _passage(chunk, rank):
+    text = getattr(chunk, "page_content", chunk)
+    metadata = getattr(chunk, "metadata", None) or {}
+    return {"text": text.strip(), "rank": rank, "metadata": metadata}
+
+
+def _dedupe(passages):
+    seen = set()
+    unique = []
+    for passage in passages:
+        digest = hashlib.sha1(" ".join(passage["text"].split()).encode("utf-8")).hexdigest()
+        if digest in seen or not passage["text"]:
+            continue
+        seen.add(digest)
+        unique.append(passage)
+
+    # Drop passages wholly contained in a longer one, the container keeps the better rank of the two
+    kept = []
+    for passage in sorted(unique, key=lambda p: -len(p["text"])):
+        container = next((other for other in kept if passage["text"] in other["text"]), None)
+        if container is None:
+            kept.append(passage)
+        else:
+            container["rank"] = min(container["rank"], passage["rank"])
+    return kept
+
+
+def _merge_overlaps(passages):
+    merged = True
+    while merged:
+        merged = False
+        for first in passages:
+            for second in passages:
+                if first is second:
+                    continue
+                joined = _join(first, second)
+                if joined is not None:
+                    first["text"] = joined
+                    first["rank"] = min(first["rank"], second["rank"])
+                    first["metadata"] = {**second["metadata"], **first["metadata"]}
+                    if "chunk_id" in second["metadata"]:
+                        first["metadata"]["last_chunk_id"] = second["metadata"].get("last_chunk_id", second["metadata"]["chunk_id"])
+                    passages = [passage for passage in passages if passage is not second]
+                    merged = True
+                    break
+            if merged:
+                break
+    return passages
+
+
+def _join(first, second):
+    # Consecutive chunks of the same document are adjacent even when the splitter left no overlap
+    first_meta, second_meta = first["metadata"], second["metadata"]
+    previous_chunk_id = second_meta.get("previous_chunk_id")
+    if previous_chunk_id and previous_chunk_id == first_meta.get("last_chunk_id", first_meta.get("chunk_id")):
+        overlap = _overlap_length(first["text"], second["text"])
+        return first["text"] + ("\n" + second["text"] if not overlap else second["text"][overlap:])
+
+    overlap = _overlap_length(first["text"], second["text"])
+    if overlap >= MIN_OVERLAP_CHARS:
+        return first["text"] + second["text"][overlap:]
+    return None
+
+
+def _overlap_length(first, second):
+    # Longest suffix of 'first' that is also a prefix of 'second'
+    probe = second[:MIN_OVERLAP_CHARS]
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _mmr(passages, mmr_lambda):
+    # Relevance comes from the retrieval rank, redundancy from word overlap, so this needs no extra embedding calls
+    word_sets = [set(passage["text"].lower().split()) for passage in passages]
+    relevance = [1.0 - passage["rank"] / max(len(passages), 1) for passage in passages]
+    selected = []
+    remaining = list(range(len(passages)))
+    while remaining:
+        def score(i):
+            redundancy = max((_jaccard(word_sets[i], word_sets[j]) for j in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return [passages[i] for i in selected]
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+DOCUMENT REGISTRY
+
+Remembers which documents each user has uploaded and which chunk ids belong to each document, so a single document
+can be listed, replaced or deleted without touching the rest of the user's corpus.
+A new upload always gets a new random id, so it never replaces another document, whatever its name or contents;
+only an explicit document_id (PUT /documents/{user_id}/{document_id}) replaces one.
+Chunk ids are "<document_id>:<content hash>", so replacing a document with a corrected PDF only re-embeds the chunks that changed.
+Each document also keeps the hash of the file it came from, so uploading an identical file again is skipped outright.
+Stored in SQLite next to the ingestion job queue, so every worker process on the box sees the same registry.
+'def corpus_version' / 'def bump_corpus_version' count changes to each user's corpus, the semantic cache (semantic_cache.py)
+compares it on every lookup so an upload in one process drops cached answers in all of them.
+
+'''
+
+DOCUMENT_REGISTRY_DB = os.getenv("DOCUMENT_REGISTRY_DB", "document_registry.sqlite3")
+
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(DOCUMENT_REGISTRY_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    _init_db(conn)
+    return conn
+
+
+def _init_db(conn):
+    # On the first connection rather than at import, so importing the app creates no files
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if _db_ready:
+            return
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    source TEXT,
+                    chunk_count INTEGER NOT NULL,
+                    page_count INTEGER,
+                    file_hash TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, document_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    page INTEGER,
+                    content_hash TEXT NOT NULL,
+                    PRIMARY KEY (user_id, chunk_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks (user_id, document_id)")
+            # Registries created before upload deduplication existed lack this column
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "file_hash" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN file_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (user_id, file_hash)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS corpus_versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+        _db_ready = True
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_by_file_hash(user_id, file_hash):
+    """
+    Return the id of the user's document that was built from an identical file, or None.
+    """
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT document_id FROM documents WHERE user_id = ? AND file_hash = ? ORDER BY updated_at DESC LIMIT 1",
+            (user_id, file_hash),
+        ).fetchone()
+    return row["document_id"] if row else None
+
+
+def get_chunk_ids(user_id, document_id):
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT chunk_id FROM chunks WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+        ).fetchall()
+    return {row["chunk_id"] for row in rows}
+
+
+def get_chunks(user_id, document_id):
+    """
+    {chunk_id: (page, previous_chunk_id)} of a stored document, the neighbour being the chunk before it in the document.
+    """
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT chunk_id, page FROM chunks WHERE user_id = ? AND document_id = ? ORDER BY chunk_index",
+            (user_id, document_id),
+        ).fetchall()
+    chunks, previous_chunk_id = {}, None
+    for row in rows:
+        chunks[row["chunk_id"]] = (row["page"], previous_chunk_id)
+        previous_chunk_id = row["chunk_id"]
+    return chunks
+
+
+def save_document(user_id, document_id, source, chunks, file_hash=None):
+    """
+    Replace the registry entry of one document. chunks are (chunk_id, page, content_hash) in document order.
+    """
+    now = time.time()
+    pages = {page for _, page, _ in chunks if page is not None}
+    with closing(_connect()) as conn, conn:
+        created = conn.execute(
+            "SELECT created_at FROM documents WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+        ).fetchone()
+        conn.execute("DELETE FROM chunks WHERE user_id = ? AND document_id = ?", (user_id, document_id))
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks (user_id, document_id, chunk_id, chunk_index, page, content_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            [(user_id, document_id, chunk_id, index, page, chunk_hash) for index, (chunk_id, page, chunk_hash) in enumerate(chunks)],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (user_id, document_id, source, chunk_count, page_count, file_hash, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, document_id, source, len(chunks), max(pages) if pages else None, file_hash,
+             created["created_at"] if created else now, now),
+        )
+
+
+def list_documents(user_id):
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT document_id, source, chunk_count, page_count, created_at, updated_at FROM documents "
+            "WHERE user_id = ? ORDER BY updated_at DESC",
+            (user_id,),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_document(user_id, document_id):
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT document_id, source, chunk_count, page_count, created_at, updated_at FROM documents "
+            "WHERE user_id = ? AND document_id = ?",
+            (user_id, document_id),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def delete_document(user_id, document_id):
+    """
+    Remove a document from the registry and return the chunk ids that belonged to it.
+    """
+    chunk_ids = get_chunk_ids(user_id, document_id)
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM chunks WHERE user_id = ? AND document_id = ?", (user_id, document_id))
+        conn.execute("DELETE FROM documents WHERE user_id = ? AND document_id = ?", (user_id, document_id))
+    return chunk_ids
+
+
+def corpus_version(user_id):
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT version FROM corpus_versions WHERE user_id = ?", (user_id,)).fetchone()
+    return row["version"] if row else 0
+
+
+def bump_corpus_version(user_id):
+    """
+    Record that the user's corpus changed and return the new version.
+    """
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT INTO corpus_versions (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+            (user_id,),
+        )
+        return conn.execute("SELECT version FROM corpus_versions WHERE user_id = ?", (user_id,)).fetchone()["version"]
+
+
+def clear_user(user_id):
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM chunks WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from contextlib import closing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+EMBEDDING CACHE
+
+Students upload the same syllabi and textbooks again and again, and the same chunk text always embeds to the same vector.
+'class EmbeddingCache' keeps chunk-hash -> embedding in SQLite, stored as raw float32 bytes (6 KB per ada-002 vector),
+shared by every user and every worker process on the box.
+'def cached' wraps an embedder (list[str] -> list[vector]) so only the texts the cache hasn't seen go to the embedding API,
+which means a repeat upload, by the same student or another one, costs no embedding calls at all.
+
+'''
+
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.sqlite3")
+# SQLite caps the number of parameters in one statement, so lookups go in chunks of this size
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, db_path=EMBEDDING_CACHE_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uploads_deduplicated = 0
+        self._db_ready = False
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._init_db(conn)
+        return conn
+
+    def _init_db(self, conn):
+        # On the first connection rather than in __init__, so importing the module creates no files
+        if self._db_ready:
+            return
+        with self._db_lock:
+            if self._db_ready:
+                return
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        model TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        PRIMARY KEY (model, text_hash)
+                    )
+                    """
+                )
+            self._db_ready = True
+
+    def get_many(self, model, hashes):
+        """
+        Return {text_hash: vector} for the hashes that are cached.
+        """
+        found = {}
+        hashes = list(set(hashes))
+        with closing(self._connect()) as conn:
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[i:i + _LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                found.update({row[0]: np.frombuffer(row[1], dtype=np.float32).tolist() for row in rows})
+        return found
+
+    def put_many(self, model, vectors):
+        """
+        vectors is {text_hash: vector}.
+        """
+        if not vectors:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
+
+    def cached(self, embedder, model):
+        """
+        Wrap embedder (list[str] -> list[vector]) so cached texts skip the embedding call.
+        """
+        def embed(texts):
+            hashes = [text_hash(text) for text in texts]
+            found = self.get_many(model, hashes)
+
+            # Identical texts within one batch are embedded once
+            missing = {}
+            for key, text in zip(hashes, texts):
+                if key not in found:
+                    missing.setdefault(key, text)
+            if missing:
+                new_vectors = dict(zip(missing, embedder(list(missing.values()))))
+                self.put_many(model, new_vectors)
+                found.update(new_vectors)
+
+            with self._lock:
+                self.hits += len(texts) - len(missing)
+                self.misses += len(missing)
+            return [found[key] for key in hashes]
+        return embed
+
+    def record_deduplicated_upload(self):
+        with self._lock:
+            self.uploads_deduplicated += 1
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "uploads_deduplicated": self.uploads_deduplicated,
+            }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+EMBEDDING + UPSERT ENGINE
+
+Turns a stream of text chunks into vectors in the index with tunable batching and concurrency.
+'class IngestionEngine' embeds chunks in batches of embed_batch_size on embed_workers threads, then upserts the vectors
+in batches of upsert_batch_size on upsert_workers threads. Every batch is retried on its own, so one flaky request
+costs a retry of that batch rather than the whole document.
+The embedder and upserter are plain callables, so bench_ingestion.py can drive the same engine with fake_backends.py.
+
+'''
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "3"))
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "0.5"))
+
+
+class IngestionError(Exception):
+    def __init__(self, stats):
+        self.stats = stats
+        super().__init__(
+            f"{len(stats['failed_batches'])} batch(es) failed after retries, "
+            f"{stats['vectors_upserted']}/{stats['chunks']} vectors were upserted"
+        )
+
+
+class IngestionEngine:
+    def __init__(
+        self,
+        embedder,
+        upserter,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        embed_workers=EMBED_WORKERS,
+        upsert_batch_size=UPSERT_BATCH_SIZE,
+        upsert_workers=UPSERT_WORKERS,
+        max_retries=INGEST_MAX_RETRIES,
+        retry_backoff=INGEST_RETRY_BACKOFF_SECONDS,
+    ):
+        self.embedder = embedder  # list[str] -> list[list[float]], e.g. OpenAIEmbeddings.embed_documents
+        self.upserter = upserter  # list[(id, values, metadata)] -> None, e.g. a Pinecone index's upsert
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_workers = upsert_workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def run(self, chunks, progress=None, id_prefix=None, metadata=None):
+        """
+        Embed and upsert every chunk. Chunks can be plain strings, (text, metadata) pairs or (id, text, metadata) triples.
+        Without an explicit id a chunk gets "<id_prefix>:<n>", so rerunning with the same prefix overwrites instead of duplicating.
+        Returns the run statistics, or raises IngestionError if any batch still failed after its retries.
+        """
+        id_prefix = id_prefix or uuid.uuid4().hex
+        stats = {
+            "chunks": 0,
+            "chunks_embedded": 0,
+            "vectors_upserted": 0,
+            "embed_batches": 0,
+            "upsert_batches": 0,
+            "retries": 0,
+            "failed_batches": [],
+        }
+        lock = threading.Lock()
+        # Embedded-but-not-yet-upserted vectors are the memory cost, so cap the embed batches in flight
+        in_flight = threading.BoundedSemaphore(2 * self.embed_workers)
+        start = time.perf_counter()
+
+        # The embed pool has to drain before the upsert pool shuts down, embed workers submit into it
+        with ThreadPoolExecutor(self.upsert_workers, thread_name_prefix="upsert") as upsert_pool:
+            with ThreadPoolExecutor(self.embed_workers, thread_name_prefix="embed") as embed_pool:
+                batch = []
+                for chunk in chunks:
+                    if isinstance(chunk, tuple) and len(chunk) == 3:
+                        vector_id, text, chunk_metadata = chunk
+                    else:
+                        text, chunk_metadata = chunk if isinstance(chunk, tuple) else (chunk, {})
+                        vector_id = f"{id_prefix}:{stats['chunks']}"
+                    record_metadata = {**(metadata or {}), **chunk_metadata, "text": text}
+                    batch.append((vector_id, text, record_metadata))
+                    stats["chunks"] += 1
+                    if len(batch) >= self.embed_batch_size:
+                        self._submit(embed_pool, upsert_pool, batch, stats, lock, in_flight, progress)
+                        batch = []
+                if batch:
+                    self._submit(embed_pool, upsert_pool, batch, stats, lock, in_flight, progress)
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["chunks_per_sec"] = stats["vectors_upserted"] / stats["seconds"] if stats["seconds"] else 0.0
+        if stats["failed_batches"]:
+            raise IngestionError(stats)
+        return stats
+
+    def _submit(self, embed_pool, upsert_pool, batch, stats, lock, in_flight, progress):
+        in_flight.acquire()
+        future = embed_pool.submit(self._embed_and_upsert, upsert_pool, batch, stats, lock, progress)
+
+        def done(future):
+            in_flight.release()
+            # Anything _embed_and_upsert didn't handle itself (e.g. a progress callback blowing up) still counts as a failed batch
+            if future.exception() is not None:
+                self._record_failure("embed", batch, future.exception(), stats, lock)
+
+        future.add_done_callback(done)
+
+    def _embed_and_upsert(self, upsert_pool, batch, stats, lock, progress):
+        try:
+            vectors = self._with_retries(self.embedder, [text for _, text, _ in batch], stats=stats, lock=lock)
+        except Exception as e:
+            self._record_failure("embed", batch, e, stats, lock)
+            return
+
+        _count(stats, lock, progress, "chunks_embedded", len(batch))
+        with lock:
+            stats["embed_batches"] += 1
+
+        records = [(vector_id, values, record_metadata) for (vector_id, _, record_metadata), values in zip(batch, vectors)]
+        upserts = [
+            upsert_pool.submit(self._upsert, records[i:i + self.upsert_batch_size], stats, lock, progress)
+            for i in range(0, len(records), self.upsert_batch_size)
+        ]
+        for upsert in upserts:
+            upsert.result()
+
+    def _upsert(self, records, stats, lock, progress):
+        try:
+            self._with_retries(self.upserter, records, stats=stats, lock=lock)
+        except Exception as e:
+            self._record_failure("upsert", records, e, stats, lock)
+            return
+
+        _count(stats, lock, progress, "vectors_upserted", len(records))
+        with lock:
+            stats["upsert_batches"] += 1
+
+    def _with_retries(self, fn, payload, stats, lock):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(payload)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                with lock:
+                    stats["retries"] += 1
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def _record_failure(self, stage, batch, error, stats, lock):
+        print(f"❌ ERROR: {stage} batch {batch[0][0]}..{batch[-1][0]} failed: {str(error)}")
+        with lock:
+            stats["failed_batches"].append(
+                {"stage": stage, "first_id": batch[0][0], "last_id": batch[-1][0], "size": len(batch), "error": str(error)}
+            )
+
+
+def _count(stats, lock, progress, field, amount):
+    with lock:
+        stats[field] += amount
+    if progress:
+        progress(field, amount)
@@ -0,0 +1,325 @@
+import os
+import re
+import threading
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from scheduling import SCHEDULE_TIMEZONE
+
+load_dotenv()
+
+'''
+
+RULE-BASED SCHEDULING-DETAIL EXTRACTION
+
+Pulls task_name, duration_hours, week_start and week_end out of requests like "study for 2 hours next week" without a model.
+'def parse_duration' understands "2 hours", "1.5h", "90 minutes", "an hour and a half", "1h30", "two hours"...
+'def parse_dates' understands today / tomorrow / this or next week / weekend / month, weekdays ("next friday", "by friday"),
+"in 3 days", "within 5 days", ISO and US dates ("2025-03-05", "3/5") and month names ("March 5th"), and ranges of those
+'def extract_event' puts them together with the task name (what is left of the text once those phrases and the request
+wording are removed) and a confidence between 0 and 1.
+features.py only asks command-r-plus when the confidence is below EXTRACTION_MIN_CONFIDENCE, e.g. no duration was found,
+or what is left for the task name still looks like a date or a number we didn't understand.
+
+'''
+
+EXTRACTION_MIN_CONFIDENCE = float(os.getenv("EXTRACTION_MIN_CONFIDENCE", "0.75"))
+# Past this many words the "task name" is more likely a sentence we didn't parse than a name
+EXTRACTION_MAX_TASK_WORDS = int(os.getenv("EXTRACTION_MAX_TASK_WORDS", "8"))
+# A longer window is more likely a misread date than what was asked for, so the model gets a look at it
+EXTRACTION_MAX_RANGE_DAYS = int(os.getenv("EXTRACTION_MAX_RANGE_DAYS", "31"))
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "thirty": 30, "forty": 40,
+    "forty-five": 45, "sixty": 60, "ninety": 90, "couple of": 2, "a couple of": 2,
+}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+
+_NUMBER = r"(\d+(?:\.\d+)?|a couple of|couple of|forty-five|" + "|".join(
+    sorted((word for word in NUMBER_WORDS if " " not in word and word != "forty-five"), key=len, reverse=True)
+) + r")"
+_HOURS = r"(?:hours?|hrs?|h)"
+_MINUTES = r"(?:minutes?|mins?|m)"
+_FOR = r"(?:\bfor\s+)?(?:about\s+|around\s+|roughly\s+|like\s+)?"
+
+_DURATION_PATTERNS = [
+    # 1 hour 30 minutes, 2 hours and 15 mins, 1h 30m
+    (re.compile(_FOR + rf"\b{_NUMBER}\s*{_HOURS}\s*(?:and\s+)?(\d+)\s*{_MINUTES}\b", re.I), lambda m: _number(m[1]) + int(m[2]) / 60),
+    # 1h30
+    (re.compile(_FOR + r"\b(\d+)h(\d{2})\b", re.I), lambda m: int(m[1]) + int(m[2]) / 60),
+    # 2 and a half hours, an hour and a half
+    (re.compile(_FOR + rf"\b{_NUMBER}\s+and\s+a\s+half\s+{_HOURS}\b", re.I), lambda m: _number(m[1]) + 0.5),
+    (re.compile(_FOR + rf"\b{_NUMBER}\s+{_HOURS}\s+and\s+a\s+half\b", re.I), lambda m: _number(m[1]) + 0.5),
+    (re.compile(_FOR + r"\bhalf\s+an\s+hour\b", re.I), lambda m: 0.5),
+    (re.compile(_FOR + rf"\b{_NUMBER}\s*-?\s*{_HOURS}\b", re.I), lambda m: _number(m[1])),
+    (re.compile(_FOR + rf"\b{_NUMBER}\s*-?\s*(?:minutes?|mins?)\b", re.I), lambda m: _number(m[1]) / 60),
+]
+
+_MONTH = r"(" + "|".join(month[:3] + ("(?:" + month[3:] + ")?" if len(month) > 3 else "") for month in MONTHS) + r")\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_PREFIX = r"(?:\b(?:on|by|before|until|till|from|starting|between|during|in|within|sometime|for|of|this|the)\s+)*"
+_WEEKDAY = r"(" + "|".join(day[:3] + "(?:" + day[3:] + ")?" for day in WEEKDAYS) + r")\b"
+
+# Time of day isn't used by the scheduler (see SCHEDULE_PREFERRED_TIME), these only keep it out of the task name
+_IGNORED = [
+    re.compile(r"\b(?:at|around|after|before)\s+\d{1,2}(?::\d{2})?\s*(?:am|pm)?\b", re.I),
+    re.compile(r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b", re.I),
+    re.compile(r"\b(?:in\s+the\s+)?(?:morning|afternoon|evening)s?\b", re.I),
+    re.compile(r"\b(?:tonight|asap|sometime|some\s+time|whenever)\b", re.I),
+]
+
+_LEADING = re.compile(
+    r"^(?:(?:hey|hi|ok|okay|please|pls|can\s+you|could\s+you|would\s+you|i\s+(?:need|want|have|would\s+like|'d\s+like|got)\s+to|"
+    r"i\s+(?:need|want)|need(?:\s+to)?|i\s+should|i'd\s+like\s+to|i\s+must|help\s+me|let\s+me|remind\s+me\s+to|"
+    r"schedule|book|plan|block(?:\s+off|\s+out)?|find|set\s+aside|add|put|reserve|allocate|me|some|time|a|an|slot|"
+    r"session|to|for|in|of|the)\b[\s,]*)+",
+    re.I,
+)
+_TRAILING = re.compile(r"(?:[\s,]+\b(?:for|on|in|at|by|to|during|the|a|an|and|please|pls|sometime|time)\b)+$", re.I)
+# What a task name shouldn't contain, if it does we probably missed a date or a duration
+_SUSPICIOUS = re.compile(
+    r"\b\d{1,2}\b|[:/]\d|\b(?:hours?|hrs?|minutes?|mins?|week|weekend|month|day|days|today|tomorrow|yesterday|"
+    + "|".join(WEEKDAYS) + "|" + "|".join(MONTHS) + r")\b",
+    re.I,
+)
+
+_stats_lock = threading.Lock()
+extraction_stats = {"rule_hits": 0, "llm_fallbacks": 0}
+
+
+def _number(text):
+    text = text.lower()
+    return float(NUMBER_WORDS[text]) if text in NUMBER_WORDS else float(text)
+
+
+def _today(now=None):
+    return (now or datetime.now(ZoneInfo(SCHEDULE_TIMEZONE))).date()
+
+
+def parse_duration(text):
+    """
+    Return (hours, (start, end) span of the phrase) for the first duration in text, or (None, None).
+    """
+    for pattern, hours in _DURATION_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            value = hours(match)
+            if value > 0:
+                return round(value, 2), match.span()
+    return None, None
+
+
+def _week_bounds(day):
+    monday = day - timedelta(days=day.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def _month_day(month_name, day, year, today):
+    """
+    (day, day, year_given) or None for a date that doesn't exist ("March 0", "February 30").
+    Without a year the date is in this year, parse_dates decides whether it means next year's.
+    """
+    month = next(i for i, name in enumerate(MONTHS, 1) if name.startswith(month_name.lower()[:3]))
+    try:
+        value = date(int(year) if year else today.year, month, int(day))
+    except ValueError:
+        return None
+    return value, value, bool(year)
+
+
+def _next_year(value):
+    try:
+        return value.replace(year=value.year + 1)
+    except ValueError:
+        # February 29th, and next year isn't a leap year
+        return None
+
+
+def _numeric_date(month, day, year, today):
+    try:
+        year = int(year) + 2000 if year and len(year) == 2 else int(year) if year else today.year
+        value = date(year, int(month), int(day))
+    except ValueError:
+        return None
+    return value
+
+
+def _date_patterns(today):
+    """
+    (pattern, function(match) -> (first_day, last_day) or None).
+    Most specific phrases first; a later pattern never matches inside a phrase an earlier one took.
+    """
+    this_monday, this_sunday = _week_bounds(today)
+    next_monday = this_monday + timedelta(days=7)
+
+    def weekday(name, week_offset=None):
+        index = next(i for i, day in enumerate(WEEKDAYS) if day.startswith(name.lower()[:3]))
+        if week_offset is None:
+            # The next one, today counts
+            return today + timedelta(days=(index - today.weekday()) % 7)
+        return this_monday + timedelta(days=7 * week_offset + index)
+
+    def day_range(first, last):
+        return (first, last) if first and last else None
+
+    return [
+        (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), lambda m: day_range(*[_numeric_date(m[2], m[3], m[1], today)] * 2)),
+        (re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?\b"), lambda m: day_range(*[_numeric_date(m[1], m[2], m[3], today)] * 2)),
+        (re.compile(rf"\b{_MONTH}\s+{_DAY}(?:,?\s+(\d{{4}}))?\b", re.I), lambda m: _month_day(m[1], m[2], m[3], today)),
+        (re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH}(?:,?\s+(\d{{4}}))?\b", re.I), lambda m: _month_day(m[2], m[1], m[3], today)),
+        (re.compile(r"\bday\s+after\s+tomorrow\b", re.I), lambda m: (today + timedelta(days=2),) * 2),
+        (re.compile(r"\btoday\b|\btonight\b", re.I), lambda m: (today, today)),
+        (re.compile(r"\btomorrow\b", re.I), lambda m: (today + timedelta(days=1),) * 2),
+        (re.compile(r"\b(?:within|in)\s+the\s+next\s+" + _NUMBER + r"\s+days?\b|\bwithin\s+" + _NUMBER + r"\s+days?\b", re.I),
+         lambda m: (today, today + timedelta(days=int(_number(m[1] or m[2]))))),
+        (re.compile(r"\bin\s+" + _NUMBER + r"\s+days?\b", re.I), lambda m: (today + timedelta(days=int(_number(m[1]))),) * 2),
+        (re.compile(r"\bnext\s+weekend\b", re.I), lambda m: (next_monday + timedelta(days=5), next_monday + timedelta(days=6))),
+        (re.compile(r"\b(?:this\s+)?weekend\b", re.I), lambda m: (max(this_monday + timedelta(days=5), today), this_sunday)),
+        (re.compile(r"\b(?:next|the\s+following)\s+week\b", re.I), lambda m: (next_monday, next_monday + timedelta(days=6))),
+        (re.compile(r"\b(?:this|the)\s+week\b|\bthis\s+coming\s+week\b|\bend\s+of\s+(?:the\s+)?week\b", re.I),
+         lambda m: (today, this_sunday)),
+        (re.compile(r"\bnext\s+month\b", re.I), lambda m: _next_month(today)),
+        (re.compile(r"\b(?:this|the)\s+month\b|\bend\s+of\s+(?:the\s+)?month\b", re.I),
+         lambda m: (today, today.replace(day=monthrange(today.year, today.month)[1]))),
+        # "by friday" is a deadline, anywhere from today until then
+        (re.compile(r"\b(?:by|before|until|till)\s+(?:this\s+|next\s+)?" + _WEEKDAY, re.I),
+         lambda m: (today, weekday(m[1], 1 if "next" in m[0].lower() else None))),
+        (re.compile(r"\bnext\s+" + _WEEKDAY, re.I), lambda m: (weekday(m[1], 1),) * 2),
+        (re.compile(r"\b(?:this\s+)?" + _WEEKDAY, re.I), lambda m: (weekday(m[1]),) * 2),
+    ]
+
+
+def _next_month(today):
+    first = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return first, first.replace(day=monthrange(first.year, first.month)[1])
+
+
+def parse_dates(text, now=None):
+    """
+    Return ((week_start, week_end), spans of the date phrases), or (None, []) when the text names no dates.
+    Several dates ("between March 3 and March 7", "monday or wednesday") become the range from the first to the last.
+    """
+    today = _today(now)
+    found, spans, positions = [], [], []
+    for pattern, days in _date_patterns(today):
+        for match in pattern.finditer(text):
+            if any(start < match.end() and match.start() < end for start, end in spans):
+                continue
+            value = days(match)
+            if value is None:
+                continue
+            found.append(value)
+            positions.append(match.start())
+            # Take the prepositions in front of the phrase with it, so they don't end up in the task name
+            prefix = re.search(_PREFIX + r"$", text[:match.start()], re.I)
+            spans.append((prefix.start() if prefix else match.start(), match.end()))
+    found = _roll_past_dates(found, positions, today)
+    if not found:
+        return None, []
+
+    first = min(value[0] for value in found)
+    last = max(value[1] for value in found)
+    if first < today:
+        first = today
+    return (first, max(last, first)), spans
+
+
+def _roll_past_dates(found, positions, today):
+    """
+    Month names without a year ("March 5") are read as this year's; which of the past ones mean next year's depends on
+    the rest of the request. All of them in the past: "March 5" in December, next year's. Otherwise only a past date
+    named after one still to come is rolled ("December 28 to January 3"), one named before is the start of a range
+    that is already under way ("between March 3 and March 7" on March 5) and stays.
+    """
+    yearless = [i for i, value in enumerate(found) if len(value) == 3 and not value[2]]
+    if not yearless:
+        return [value[:2] for value in found]
+    all_past = all(found[i][1] < today for i in yearless)
+    rolled = []
+    for i, value in enumerate(found):
+        first, last = value[:2]
+        if i in yearless and last < today and (
+            all_past or any(positions[j] < positions[i] and found[j][1] >= today for j in yearless)
+        ):
+            first, last = _next_year(first), _next_year(last)
+            if first is None:
+                continue
+        rolled.append((first, last))
+    return rolled
+
+
+def _blank(text, spans):
+    for start, end in sorted(spans, reverse=True):
+        # Same length, so the other spans still line up
+        text = text[:start] + " " * (end - start) + text[end:]
+    return text
+
+
+def task_name(text, spans):
+    """
+    What is left of the request once dates, durations and the request wording are taken out.
+    """
+    rest = _blank(text, spans)
+    for pattern in _IGNORED:
+        rest = pattern.sub(" ", rest)
+    rest = " ".join(rest.split()).strip(" ,.!?;:-")
+    previous = None
+    while previous != rest:
+        previous = rest
+        rest = _LEADING.sub("", rest).strip(" ,.!?;:-")
+        rest = _TRAILING.sub("", rest).strip(" ,.!?;:-")
+    return rest[:1].upper() + rest[1:] if rest else ""
+
+
+def extract_event(text, now=None):
+    """
+    Return (event_data, confidence). event_data has the same fields the LLM extraction returns.
+    """
+    duration_hours, duration_span = parse_duration(text)
+    week, date_spans = parse_dates(_blank(text, [duration_span]) if duration_span else text, now)
+    spans = date_spans + ([duration_span] if duration_span else [])
+    name = task_name(text, spans)
+
+    if week is None:
+        # Nothing said about when: the coming seven days, like scheduling.py defaults to
+        today = _today(now)
+        week = (today, today + timedelta(days=6))
+
+    event_data = {
+        "task_name": name,
+        "duration_hours": duration_hours,
+        "week_start": week[0].isoformat(),
+        "week_end": week[1].isoformat(),
+    }
+    if not duration_hours or not name:
+        return event_data, 0.0
+
+    words = name.split()
+    confidence = 0.5                                                    # a duration
+    confidence += 0.3 if len(words) <= EXTRACTION_MAX_TASK_WORDS else 0.1   # a plausible name
+    confidence += 0.2 if date_spans else 0.1                            # said when, or we default to the coming week
+    if _SUSPICIOUS.search(name):
+        confidence -= 0.4
+    if duration_hours > 12:
+        confidence -= 0.3
+    if (week[1] - week[0]).days > EXTRACTION_MAX_RANGE_DAYS:
+        confidence -= 0.4
+    return event_data, round(max(confidence, 0.0), 2)
+
+
+def record_extraction(source):
+    with _stats_lock:
+        extraction_stats["rule_hits" if source == "rules" else "llm_fallbacks"] += 1
+
+
+def extraction_stats_snapshot():
+    with _stats_lock:
+        total = extraction_stats["rule_hits"] + extraction_stats["llm_fallbacks"]
+        return {
+            **extraction_stats,
+            "rule_hit_rate": extraction_stats["rule_hits"] / total if total else 0.0,
+            "min_confidence": EXTRACTION_MIN_CONFIDENCE,
+        }
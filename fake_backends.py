@@ -0,0 +1,94 @@
+import hashlib
+import random
+import threading
+import time
+import numpy as np
+
+'''
+
+FAKE BACKENDS FOR BENCHMARKS
+
+Local stand-ins for the OpenAI embedding API and a Pinecone index, so the ingestion and retrieval paths can be
+benchmarked offline. Latency and failure rate are configurable to mimic the real services.
+'class FakeEmbeddings' has the LangChain embeddings interface (embed_documents / embed_query)
+'class FakeVectorIndex' has the parts of the Pinecone index interface we use (upsert / query / delete)
+
+'''
+
+
+class FakeEmbeddings:
+    def __init__(self, dimension=1536, call_latency=0.05, per_text_latency=0.0005, failure_rate=0.0, seed=0):
+        self.dimension = dimension
+        self.call_latency = call_latency
+        self.per_text_latency = per_text_latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.call_latency + self.per_text_latency * len(texts))
+        if fail:
+            raise ConnectionError("fake embedding backend: simulated failure")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        # Deterministic per text, and bag-of-words based so similar texts land close together
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+class FakeVectorIndex:
+    def __init__(self, call_latency=0.02, failure_rate=0.0, seed=0):
+        self.call_latency = call_latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.vectors = {}  # id -> (values, metadata)
+        self.upsert_calls = 0
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self.upsert_calls += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.call_latency)
+        if fail:
+            raise ConnectionError("fake vector backend: simulated failure")
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                self.vectors[vector_id] = (np.asarray(values, dtype=np.float32), metadata)
+
+    def query(self, vector, top_k=10, include_metadata=True, namespace=None):
+        time.sleep(self.call_latency)
+        with self._lock:
+            items = list(self.vectors.items())
+        if not items:
+            return {"matches": []}
+        matrix = np.stack([values for _, (values, _) in items])
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        top = np.argsort(-scores)[:top_k]
+        return {
+            "matches": [
+                {"id": items[i][0], "score": float(scores[i]), "metadata": items[i][1][1] if include_metadata else None}
+                for i in top
+            ]
+        }
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        with self._lock:
+            if delete_all:
+                self.vectors.clear()
+            for vector_id in ids or []:
+                self.vectors.pop(vector_id, None)
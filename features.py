@@ -1,41 +1,97 @@
+import asyncio
 import base64
-import cohere
+import inspect
 import os
+import threading
+from contextlib import asynccontextmanager
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import auth, credentials, firestore
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Header, Depends, Request, File, UploadFile
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 import json
-import requests
-from vector_rag import *
+import re
+import uuid
+import document_registry
+from vector_rag import delete_document, delete_pinecone_index, generate_rag_answer, get_embeddings
+from vector_store import get_vector_store
+from llm_gateway import cohere_chat, cohere_chat_stream, run_blocking, get_cohere_client, get_openai_client, close_clients
+from ingestion_jobs import submit_job, get_job, start_workers, stop_workers
+from pdf_extraction import shutdown_pool
+from scheduling import get_available_slots, best_slot, SCHEDULE_LLM_PICKER
+from calendar_provider import get_calendar
+from event_extraction import extract_event, record_extraction, EXTRACTION_MIN_CONFIDENCE
+from priority_classifier import classify_priority, classify_priorities, normalize_priority, record_priority, PRIORITY_MIN_CONFIDENCE
 
 # Load environment variables
 load_dotenv()
-coherekey = os.getenv("COHERE_API_KEY")
-if not coherekey:
-    raise ValueError("COHERE_API_KEY not found in environment variables")
 
-# Initialize Cohere client
-co = cohere.ClientV2(api_key=coherekey)
+# Warm the Firestore, LLM, embedding and vector store clients in the background as soon as the app starts, instead of
+# on the first request that needs each one
+PRELOAD_CLIENTS = os.getenv("PRELOAD_CLIENTS", "false").lower() == "true"
 
-firebase_credentials_base64 = os.getenv("FIREBASE_CREDENTIALS")
-firebase_credentials_json = json.loads(base64.b64decode(firebase_credentials_base64).decode("utf-8"))
+_db = None
+_firebase_lock = threading.Lock()
 
-# Initialize Firestore
-cred = credentials.Certificate(firebase_credentials_json)
-# Initialize Firebase Admin SDK (Only run once)
-try:
-    firebase_admin.initialize_app(cred)
-except ValueError:
-    print("Firebase already initialized.")
-
-# Firestore client
-db = firestore.client()
+def get_db():
+    """
+    The Firestore client. Firebase Admin is initialized on first use, so importing this module needs no credentials.
+    """
+    global _db
+    if _db is None:
+        with _firebase_lock:
+            if _db is None:
+                firebase_credentials_base64 = os.getenv("FIREBASE_CREDENTIALS")
+                if not firebase_credentials_base64:
+                    raise ValueError("FIREBASE_CREDENTIALS not found in environment variables")
+                firebase_credentials_json = json.loads(base64.b64decode(firebase_credentials_base64).decode("utf-8"))
+
+                # Initialize Firebase Admin SDK (Only run once)
+                try:
+                    firebase_admin.initialize_app(credentials.Certificate(firebase_credentials_json))
+                except ValueError:
+                    print("Firebase already initialized.")
+
+                # Firestore client
+                _db = firestore.client()
+    return _db
+
+def preload_clients():
+    for name, accessor in (("Firestore", get_db), ("Cohere", get_cohere_client), ("OpenAI", get_openai_client),
+                           ("embeddings", get_embeddings), ("vector store", get_vector_store)):
+        try:
+            accessor()
+        except Exception as e:
+            print(f"❌ ERROR: could not preload the {name} client: {str(e)}")
+    print("✅ Clients preloaded.")
+
+# (startup, shutdown) pairs of the modules that build on this app, e.g. app.py's chat log buffer; started in order,
+# stopped in reverse. Either function may be async.
+LIFESPAN_HOOKS = []
+
+async def _call_hook(hook):
+    result = hook()
+    if inspect.isawaitable(result):
+        await result
+
+@asynccontextmanager
+async def lifespan(app):
+    start_workers()
+    for startup, _ in LIFESPAN_HOOKS:
+        await _call_hook(startup)
+    if PRELOAD_CLIENTS:
+        app.state.preload = asyncio.create_task(run_blocking(preload_clients))
+    yield
+    for _, shutdown in reversed(LIFESPAN_HOOKS):
+        await _call_hook(shutdown)
+    stop_workers()
+    shutdown_pool()
+    get_calendar().close()
+    await close_clients()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # we need this so that the api is able to work with different origins/frontends
 app.add_middleware(
@@ -44,122 +100,89 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # pagination cursor of the list routes (see firestore_lists.py)
 )
 
-def prioritize_task(user_input: str) -> str:
-    try:
-        res = co.chat(
-            model="command-r7b-12-2024",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Prioritize this task using High, Medium, or Low urgency: {user_input}. Do not reply with anything else.",
-                }
-            ],
-        )
-        return res.message.content[0].text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def prioritize_task(user_input: str, use_cache: bool = True) -> str:
+    """
+    High, Medium or Low. The local classifier (priority_classifier.py) answers when it is confident,
+    the model only gets ambiguous tasks, and its answer is normalized to one of the three labels.
+    """
+    label, confidence = classify_priority(user_input)
+    if confidence >= PRIORITY_MIN_CONFIDENCE:
+        record_priority(label, "local")
+        return label
 
-# Function to summarize text using Cohere
-def summarizebot(user_input: str) -> str:
     try:
-        res = co.chat(
+        answer = await cohere_chat(
+            f"Prioritize this task using High, Medium, or Low urgency: {user_input}. Do not reply with anything else.",
             model="command-r7b-12-2024",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"I want to summarize the following text in less than 3 sentences: {user_input}. If you don't know how to respond, just say 'I don't know'.",
-                }
-            ],
+            use_cache=use_cache,
         )
-        return res.message.content[0].text
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-from datetime import datetime, timedelta
+    label = normalize_priority(answer)
+    record_priority(label, "llm")
+    return label
 
-def get_available_slots(unavailable_times, duration_hours):
+async def prioritize_tasks(user_inputs: list, use_cache: bool = True, max_concurrency: int = None) -> list:
     """
-    Given a list of unavailable times, compute the available slots for scheduling.
+    prioritize_task over a batch: one local pass, then the ambiguous tasks go to the model, max_concurrency at a time.
+    Returns a label, or the exception that failed that task, per input.
     """
+    results = [label if confidence >= PRIORITY_MIN_CONFIDENCE else None for label, confidence in classify_priorities(user_inputs)]
+    for label in results:
+        if label is not None:
+            record_priority(label, "local")
 
-    if not unavailable_times.get("events"):  # If no events exist, return the full day as available
-        return {
-            "available_times": [
-                {"date": "2025-02-05", "start_time": "00:00", "end_time": "23:59"}
-            ]
-        }
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
 
-    from datetime import datetime, timedelta
-
-    # Convert unavailable times into sorted (start, end) tuples
-    busy_times = sorted(
-        [
-            (
-                datetime.fromisoformat(event["Start"].split("+")[0]),
-                datetime.fromisoformat(event["End"].split("+")[0]),
-            )
-            for event in unavailable_times.get("events", [])
-        ],
-        key=lambda x: x[0],
-    )
-
-    # Define full day range
-    start_of_day = busy_times[0][0].replace(hour=0, minute=0, second=0)
-    end_of_day = busy_times[0][0].replace(hour=23, minute=59, second=59)
-
-    available_slots = []
-    prev_end = start_of_day
-
-    # Compute free slots
-    for start, end in busy_times:
-        if prev_end + timedelta(hours=duration_hours) <= start:
-            available_slots.append(
-                {
-                    "date": prev_end.date().isoformat(),
-                    "start_time": prev_end.strftime("%H:%M"),
-                    "end_time": (prev_end + timedelta(hours=duration_hours)).strftime("%H:%M"),
-                }
-            )
-        prev_end = max(prev_end, end)
-
-    # Check after the last event
-    if prev_end + timedelta(hours=duration_hours) <= end_of_day:
-        available_slots.append(
-            {
-                "date": prev_end.date().isoformat(),
-                "start_time": prev_end.strftime("%H:%M"),
-                "end_time": (prev_end + timedelta(hours=duration_hours)).strftime("%H:%M"),
-            }
-        )
+    async def ask_model(user_input):
+        if limit is None:
+            return await prioritize_task(user_input, use_cache)
+        async with limit:
+            return await prioritize_task(user_input, use_cache)
 
-    return {"available_times": available_slots}
+    ambiguous = [i for i, label in enumerate(results) if label is None]
+    answers = await asyncio.gather(*(ask_model(user_inputs[i]) for i in ambiguous), return_exceptions=True)
+    for i, answer in zip(ambiguous, answers):
+        results[i] = answer
+    return results
 
-def chatbot_response(user_input: str) -> str:
+# Function to summarize text using Cohere
+async def summarizebot(user_input: str, use_cache: bool = True) -> str:
     try:
-        res = co.chat(
+        return await cohere_chat(
+            f"I want to summarize the following text in less than 3 sentences: {user_input}. If you don't know how to respond, just say 'I don't know'.",
             model="command-r7b-12-2024",
-            messages=[
-                {
-                    "role": "user",
-                    "content": user_input,
-                }
-            ],
+            use_cache=use_cache,
         )
-        return res.message.content[0].text
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-def checkAvailability1(user_input: str):
+async def chatbot_response(user_input: str) -> str:
     try:
-        # Step 1: Extract Task Information
-        res = co.chat(
-            model="command-r-plus",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""
+        return await cohere_chat(user_input, model="command-r7b-12-2024")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def chatbot_response_stream(user_input: str):
+    async for token in cohere_chat_stream(user_input, model="command-r7b-12-2024"):
+        yield token
+    
+async def extract_event_details(user_input: str, use_cache: bool = True) -> dict:
+    """
+    Pull task_name, duration_hours, week_start and week_end out of the user's request.
+    The rule-based extractor (event_extraction.py) answers when it is confident, the model only gets the rest.
+    """
+    event_data, confidence = extract_event(user_input)
+    if confidence >= EXTRACTION_MIN_CONFIDENCE:
+        record_extraction("rules")
+        return event_data
+
+    record_extraction("llm")
+    response_text = await cohere_chat(
+        f"""
                     Extract scheduling details and return a JSON object:
                     {{
                         "task_name": "<Task Name>",
@@ -172,41 +195,51 @@ def checkAvailability1(user_input: str):
                     If extraction fails, return: {{}}.
 
                     Text: {user_input}
-                    """
-                }
-            ],
-        )
+                    """,
+        model="command-r-plus",
+        use_cache=use_cache,
+    )
 
-        response_text = res.message.content[0].text if res.message.content else ""
-        response_text = response_text.strip("```json").strip("```").strip()
+    # The object, whatever the model wrapped it in (```json fences, a sentence before it...)
+    match = re.search(r"\{.*\}", response_text, re.S)
 
-        # Step 2: Parse AI Response
-        try:
-            event_data = json.loads(response_text)
-            if not event_data.get("task_name") or not event_data.get("duration_hours"):
-                raise ValueError("Missing required fields in AI response.")
-        except (json.JSONDecodeError, ValueError) as e:
-            raise HTTPException(status_code=500, detail="AI returned invalid JSON.")
+    try:
+        event_data = json.loads(match.group(0) if match else response_text)
+        if not event_data.get("task_name") or not event_data.get("duration_hours"):
+            raise ValueError("Missing required fields in AI response.")
+    except (json.JSONDecodeError, ValueError, AttributeError):
+        raise HTTPException(status_code=500, detail="AI returned invalid JSON.")
 
-        print("✅ Extracted Event Data:", json.dumps(event_data, indent=2))
+    return event_data
 
-        # Step 3: Fetch Unavailable Times from Logic Apps
-        logic_apps_url = "https://prod-21.northcentralus.logic.azure.com:443/workflows/e1d025b460494c53862f958fe67c0be9/triggers/When_a_HTTP_request_is_received/paths/invoke?api-version=2016-10-01&sp=%2Ftriggers%2FWhen_a_HTTP_request_is_received%2Frun&sv=1.0&sig=3FElBEyk25j3s6YLw3L2nw45EjCugN7May7ixC6NUWc"
-        response = requests.post(logic_apps_url, json=event_data)
+async def plan_event(user_input: str, user_id: str):
+    """
+    Shared by the /checkAvailability route and checkAvailability1: extract the task, fetch the user's busy times for its week,
+    and return (event_data, available_slots, selected_time).
+    """
+    # Step 1 + 2: Extract Task Information and parse the AI response
+    event_data = await extract_event_details(user_input)
 
-        try:
-            unavailable_times = response.json()
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Logic Apps returned invalid JSON.")
+    print("✅ Extracted Event Data:", json.dumps(event_data, indent=2))
+
+    # Step 3: Fetch Unavailable Times (Logic Apps or the local calendar file, cached per user and week)
+    unavailable_times = await run_blocking(get_calendar().busy_times, user_id, event_data)
 
-        print("📅 Unavailable Times:", json.dumps(unavailable_times, indent=2))
+    print("📅 Unavailable Times:", json.dumps(unavailable_times, indent=2))
+
+    # Step 4: Compute Available Slots
+    available_slots = get_available_slots(
+        unavailable_times, event_data["duration_hours"], event_data.get("week_start"), event_data.get("week_end")
+    )
+    print("✅ Computed Available Slots:", json.dumps(available_slots, indent=2))
 
-        # Step 4: Compute Available Slots
-        available_slots = get_available_slots(unavailable_times, event_data["duration_hours"])
-        print("✅ Computed Available Slots:", json.dumps(available_slots, indent=2))
+    # Step 5: Find the Best Time
+    selected_time = await provideDates(event_data, available_slots)
+    return event_data, available_slots, selected_time
 
-        # Step 5: Find the Best Time
-        selected_time = provideDates(event_data, available_slots)
+async def checkAvailability1(user_input: str, user_id: str = "test_user"):
+    try:
+        _, available_slots, selected_time = await plan_event(user_input, user_id)
 
         # Step 6: Return response in the correct format
         return {
@@ -220,45 +253,42 @@ def checkAvailability1(user_input: str):
 
 
 
-def provideDates(event_data, available_slots):
+async def provideDates(event_data, available_slots, use_llm=SCHEDULE_LLM_PICKER):
+    """
+    Pick the time for the event. By default that's the scheduling engine's top-ranked candidate (no model call);
+    with use_llm the model chooses among the candidates, and the top candidate is still used if its answer isn't one of them.
+    """
+    best = best_slot(available_slots)
+    if not use_llm or best is None:
+        return {"selected_time": best}
+
+    candidates = [
+        {field: candidate[field] for field in ("date", "start_time", "end_time")}
+        for candidate in available_slots["candidates"]
+    ]
     try:
-        res = co.chat(
-            model="command-r-plus",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""
+        response_text = await cohere_chat(
+            f"""
                     Based on the available time slots, select the best time for scheduling the event: "{event_data['task_name']}".
 
                     **Event Duration:** {event_data['duration_hours']} hours  
-                    **Available Slots:** {json.dumps(available_slots, indent=2)}
+                    **Available Slots:** {json.dumps(candidates, indent=2)}
 
                     Respond with only the JSON:
                     {{
                         "selected_time": {{"date": "YYYY-MM-DD", "start_time": "HH:MM", "end_time": "HH:MM"}}
                     }}
-
-                    If no suitable time is found, return:
-                    {{"selected_time": null}}
-                    """
-                }
-            ],
+                    """,
+            model="command-r-plus",
         )
-
-        # Debugging: Print AI response
-        response_text = res.message.content[0].text if res.message.content else ""
         response_text = response_text.strip("```json").strip("```").strip()
-
-        try:
-            selected_slot = json.loads(response_text)
-            return selected_slot  # Return as Python dict, not JSON string
-        except json.JSONDecodeError:
-            print(f"❌ ERROR: AI returned invalid JSON → {response_text}")
-            raise HTTPException(status_code=500, detail="AI returned invalid JSON.")
-
+        selected_time = json.loads(response_text).get("selected_time")
+        if selected_time in candidates:
+            return {"selected_time": selected_time}
+        print(f"❌ ERROR: AI picked a slot that isn't a candidate → {response_text}")
     except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"❌ ERROR: AI slot picker failed, using the top candidate: {str(e)}")
+    return {"selected_time": best}
 
 def verify_firebase_token(authorization: str = Header(None)):
     """
@@ -269,6 +299,7 @@ def verify_firebase_token(authorization: str = Header(None)):
 
     token = authorization.split("Bearer ")[-1]  # Extract token
     try:
+        get_db()  # makes sure Firebase Admin is initialized
         decoded_token = auth.verify_id_token(token)
         return decoded_token  # Contains user details (uid, email)
     except Exception:
@@ -278,19 +309,61 @@ def verify_firebase_token(authorization: str = Header(None)):
 @app.post("/add_pdf/{user_id}")
 async def add_pdf(user_id: str, file: UploadFile = File(...)):
     """
-    Upload a PDF, extract text, and store embeddings in Pinecone under user-specific index.
+    Upload a PDF and queue it for ingestion into the user-specific Pinecone index.
+    Poll /jobs/{job_id} for progress.
     """
     try:
-        # Save uploaded file temporarily
-        file_path = f"temp_{file.filename}"
+        # Save uploaded file temporarily, the ingestion worker deletes it when it's done
+        file_name = os.path.basename(file.filename or "upload.pdf")
+        file_path = f"temp_{uuid.uuid4().hex}_{file_name}"
         with open(file_path, "wb") as buffer:
             buffer.write(await file.read())
         
         # Store in Pinecone under user_id
-        add_new_pdf(file_path, user_id)
-        os.remove(file_path)  # Delete temp file
+        job_id = submit_job(file_path, user_id, file_name=file_name, delete_file=True)
         
-        return {"message": f"PDF added to Pinecone under index {user_id}."}
+        return {"message": f"PDF queued for Pinecone index {user_id}.", "job_id": job_id, "status": "queued"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/documents/{user_id}")
+async def list_user_documents(user_id: str):
+    """
+    List the documents in the user's index (id, source file name, chunk and page counts).
+    """
+    try:
+        return document_registry.list_documents(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/documents/{user_id}/{document_id}")
+async def replace_document(user_id: str, document_id: str, file: UploadFile = File(...)):
+    """
+    Replace one document with a new version of the PDF. Only chunks whose content changed are re-embedded.
+    """
+    if document_registry.get_document(user_id, document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        file_name = os.path.basename(file.filename or "upload.pdf")
+        file_path = f"temp_{uuid.uuid4().hex}_{file_name}"
+        with open(file_path, "wb") as buffer:
+            buffer.write(await file.read())
+
+        job_id = submit_job(file_path, user_id, file_name=file_name, delete_file=True, document_id=document_id)
+        return {"message": f"Replacement of {document_id} queued.", "job_id": job_id, "status": "queued"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/documents/{user_id}/{document_id}")
+async def delete_user_document(user_id: str, document_id: str):
+    """
+    Delete one document's chunks from the user's index, leaving the rest of the corpus alone.
+    """
+    if document_registry.get_document(user_id, document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        deleted = await run_blocking(delete_document, user_id, document_id)
+        return {"message": f"Document {document_id} deleted from {user_id}.", "chunks_deleted": deleted}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -300,18 +373,28 @@ async def delete_index(user_id: str):
     Delete all vectors in the user's Pinecone index.
     """
     try:
-        delete_pinecone_index(user_id)
+        await run_blocking(delete_pinecone_index, user_id)
         return {"message": f"All vectors in {user_id} index deleted."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query_rag/{user_id}")
-async def query_rag(user_id: str, query: str):
+async def query_rag(user_id: str, query: str, mode: str = None):
     """
     Retrieve AI-generated answers from the user's Pinecone index.
     """
     try:
-        answer = generate_rag_answer(query, user_id)
+        answer = await generate_rag_answer(query, user_id, mode)
         return {"query": query, "answer": answer}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """
+    Report the status and progress (pages parsed, chunks embedded, vectors upserted) of an ingestion job.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
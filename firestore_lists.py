@@ -0,0 +1,143 @@
+import json
+import os
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from firebase_admin import firestore
+from llm_gateway import run_blocking
+from list_cache import list_cache
+
+load_dotenv()
+
+'''
+
+PAGINATED FIRESTORE LISTS
+
+One query helper behind the five GET /{collection}/{user_id} history routes, newest first.
+'limit' bounds the page (LIST_DEFAULT_LIMIT by default, never more than LIST_MAX_LIMIT)
+'start_after' is the id of the last item of the previous page; in JSON mode the X-Next-Cursor header carries it when there is a next page
+'select' is a comma separated list of fields, Firestore then only sends those fields over the wire
+'format=ndjson' streams one JSON object per line as documents arrive instead of building the whole list first
+Each document is decoded with to_dict() exactly once.
+Pages are served from list_cache.py when the user's list hasn't been written to since they were fetched.
+
+'''
+
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "50"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "500"))
+LIST_FORMATS = ("json", "ndjson")
+
+# collection -> (name of the id field in responses, fields a client can see)
+LIST_COLLECTIONS = {
+    "chats": ("message_id", ("user_message", "bot_response", "timestamp")),
+    "summaries": ("note_id", ("original_text", "summary", "timestamp")),
+    "events": ("event_id", ("task_name", "duration_hours", "week_start", "week_end", "selected_time", "available_slots", "timestamp")),
+    "tasks": ("task_id", ("task", "priority", "timestamp")),
+    "reminders": ("reminder_id", ("reminder_text", "repeat", "timestamp")),
+}
+
+
+def _fields(collection, select):
+    allowed = LIST_COLLECTIONS[collection][1]
+    if not select:
+        return allowed
+    fields = tuple(dict.fromkeys(field.strip() for field in select.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {unknown} for {collection}, expected any of {list(allowed)}")
+    return fields
+
+
+def _query(db, collection, user_id, limit, start_after, fields):
+    collection_ref = db.collection(collection)
+    query = (
+        collection_ref.where("user_id", "==", user_id)
+        .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        .select(list(fields))
+    )
+    if start_after:
+        cursor = collection_ref.document(start_after).get()
+        if not cursor.exists or cursor.get("user_id") != user_id:
+            raise ValueError(f"Unknown cursor '{start_after}'")
+        query = query.start_after(cursor)
+    return query.limit(limit)
+
+
+def _item(collection, doc, fields):
+    data = doc.to_dict()
+    item = {LIST_COLLECTIONS[collection][0]: doc.id}
+    item.update({field: data.get(field) for field in fields})
+    return item
+
+
+def fetch_page(db, collection, user_id, limit=LIST_DEFAULT_LIMIT, start_after=None, select=None):
+    """
+    Return (items, next_cursor); next_cursor is None on the last page.
+    """
+    fields = _fields(collection, select)
+    # One extra document tells us whether there is a next page
+    docs = list(_query(db, collection, user_id, limit + 1, start_after, fields).stream())
+    items = [_item(collection, doc, fields) for doc in docs[:limit]]
+    next_cursor = docs[limit - 1].id if len(docs) > limit else None
+    return items, next_cursor
+
+
+def _ndjson_lines(query, collection, fields):
+    for doc in query.stream():
+        yield json.dumps(jsonable_encoder(_item(collection, doc, fields))) + "\n"
+
+
+def _cached_ndjson_lines(items):
+    for item in items:
+        yield json.dumps(item) + "\n"
+
+
+def _json_response(items, next_cursor):
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(items, headers=headers)
+
+
+async def list_collection_page(db, collection, user_id, limit=None, start_after=None, select=None, format="json"):
+    """
+    The response of a GET /{collection}/{user_id} route.
+    db is the Firestore client or a function returning it (features.get_db), called inside the error handling below
+    so a missing credential is reported like any other Firestore error.
+    """
+    limit = LIST_DEFAULT_LIMIT if limit is None else limit
+    if not 1 <= limit <= LIST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LIST_MAX_LIMIT}")
+    if format not in LIST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {LIST_FORMATS}")
+
+    try:
+        db = db() if callable(db) else db
+    except Exception as e:
+        # Its own block, get_db raises ValueError for a missing credential and that isn't the client's fault
+        raise HTTPException(status_code=500, detail=str(e))
+
+    params = (limit, start_after, select)
+    try:
+        cached = await run_blocking(list_cache.get, collection, user_id, params)
+        if cached is not None:
+            items, next_cursor = cached
+            if format == "ndjson":
+                return StreamingResponse(_cached_ndjson_lines(items), media_type="application/x-ndjson")
+            return _json_response(items, next_cursor)
+
+        if format == "ndjson":
+            # Streamed pages aren't cached, the point of streaming is not to hold the whole page
+            fields = _fields(collection, select)
+            query = await run_blocking(_query, db, collection, user_id, limit, start_after, fields)
+            # Starlette iterates a plain generator in its thread pool, so the blocking stream stays off the event loop
+            return StreamingResponse(_ndjson_lines(query, collection, fields), media_type="application/x-ndjson")
+
+        version = await run_blocking(list_cache.version, collection, user_id)
+        items, next_cursor = await run_blocking(fetch_page, db, collection, user_id, limit, start_after, select)
+        items = jsonable_encoder(items)
+        await run_blocking(list_cache.set, collection, user_id, params, [items, next_cursor], version)
+        return _json_response(items, next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
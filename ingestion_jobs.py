@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+from dotenv import load_dotenv
+from vector_rag import add_new_pdf
+
+load_dotenv()
+
+'''
+
+INGESTION JOB QUEUE
+
+PDF uploads are queued here instead of being processed inside the HTTP request.
+The queue is a SQLite table, so it survives restarts and is shared by every uvicorn worker on the box without a broker.
+'def submit_job' records an uploaded file and returns its job id straight away
+'def get_job' returns the job's status and progress counters for the /jobs/{job_id} route
+'def start_workers' / 'def stop_workers' run INGEST_WORKERS worker threads (one by default) that claim queued jobs and call add_new_pdf
+
+'''
+
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", "ingest_jobs.sqlite3")
+# One worker per process: PyMuPDF isn't thread-safe, and big PDFs are already extracted in parallel by pdf_extraction.py's process pool
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1"))
+# A running job that hasn't reported progress for this long is assumed to belong to a dead worker and is requeued
+INGEST_STALE_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", "600"))
+
+PROGRESS_FIELDS = ("pages_total", "pages_parsed", "chunks_embedded", "vectors_upserted")
+
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_workers = []
+
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(INGEST_JOBS_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    _init_db(conn)
+    return conn
+
+
+def _init_db(conn):
+    # On the first connection rather than at import, so importing the app creates no files
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if _db_ready:
+            return
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT,
+                    document_id TEXT,
+                    delete_file INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    pages_total INTEGER NOT NULL DEFAULT 0,
+                    pages_parsed INTEGER NOT NULL DEFAULT 0,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    vectors_upserted INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, created_at)")
+            # Queues created before document replacement existed lack this column
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+            if "document_id" not in columns:
+                conn.execute("ALTER TABLE ingest_jobs ADD COLUMN document_id TEXT")
+        _db_ready = True
+
+
+def submit_job(file_path, user_id, file_name=None, delete_file=False, document_id=None) -> str:
+    """
+    Queue a saved PDF for ingestion into the user's index and return the job id.
+    document_id replaces that document; without it the upload is a new document with a new id.
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT INTO ingest_jobs (job_id, user_id, file_path, file_name, document_id, delete_file, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+            (job_id, user_id, file_path, file_name, document_id, int(delete_file), now, now),
+        )
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id):
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job.pop("file_path")
+    job["delete_file"] = bool(job["delete_file"])
+    return job
+
+
+def _claim_next_job():
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND updated_at < ?",
+            (now, now - INGEST_STALE_SECONDS),
+        )
+        row = conn.execute(
+            "SELECT job_id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        # Only one worker (in any process) wins the status flip
+        claimed = conn.execute(
+            "UPDATE ingest_jobs SET status = 'running', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+            (now, row["job_id"]),
+        ).rowcount
+        if not claimed:
+            return None
+        return dict(conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (row["job_id"],)).fetchone())
+
+
+def _progress_reporter(job_id):
+    def progress(field, amount):
+        if field not in PROGRESS_FIELDS:
+            return
+        # pages_total is a value, every other field is a counter
+        expression = "?" if field == "pages_total" else f"{field} + ?"
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                f"UPDATE ingest_jobs SET {field} = {expression}, updated_at = ? WHERE job_id = ?",
+                (amount, time.time(), job_id),
+            )
+    return progress
+
+
+def _finish_job(job_id, status, error=None, document_id=None):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = ?, error = ?, document_id = COALESCE(?, document_id), updated_at = ? WHERE job_id = ?",
+            (status, error, document_id, time.time(), job_id),
+        )
+
+
+def _run_job(job):
+    try:
+        document_id = add_new_pdf(
+            job["file_path"],
+            job["user_id"],
+            progress=_progress_reporter(job["job_id"]),
+            source=job["file_name"],
+            document_id=job["document_id"],
+        )
+        _finish_job(job["job_id"], "done", document_id=document_id)
+        print(f"✅ Ingestion job {job['job_id']} finished for {job['user_id']}.")
+    except Exception as e:
+        traceback.print_exc()
+        _finish_job(job["job_id"], "failed", str(e))
+        print(f"❌ ERROR: ingestion job {job['job_id']} failed: {str(e)}")
+    finally:
+        if job["delete_file"] and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+
+def _worker_loop():
+    while not _stopping.is_set():
+        try:
+            job = _claim_next_job()
+        except sqlite3.OperationalError as e:
+            print(f"❌ ERROR: could not claim ingestion job: {str(e)}")
+            job = None
+
+        if job is None:
+            _wakeup.wait(INGEST_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        _run_job(job)
+
+
+def start_workers(count=INGEST_WORKERS):
+    # The first connection creates the queue's tables, at startup rather than under the first upload
+    _connect().close()
+    _stopping.clear()
+    while len(_workers) < count:
+        worker = threading.Thread(target=_worker_loop, name=f"ingest-worker-{len(_workers)}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def stop_workers(timeout=5):
+    """
+    Stop claiming new jobs. A job that is mid-way stays 'running' and is requeued once it goes stale.
+    """
+    _stopping.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+HISTORY LIST CACHE
+
+Read-through cache in front of the five GET /{collection}/{user_id} Firestore queries (see firestore_lists.py).
+Entries are scoped per (collection, user_id) and carry that pair's version; every write route calls 'def invalidate'
+for exactly the collection and user it wrote, which bumps the version so only that user's pages of that list are refetched.
+'class ListCache' keeps an in-memory LRU with a TTL, and optionally a SQLite file (LIST_CACHE_DB) so every uvicorn worker
+on the box shares both the cached pages and the versions, so a write in one worker invalidates the others too.
+
+'''
+
+LIST_CACHE_MAX_ENTRIES = int(os.getenv("LIST_CACHE_MAX_ENTRIES", "2048"))
+# Safety net for writes that don't go through this API (e.g. edits in the Firebase console)
+LIST_CACHE_TTL_SECONDS = float(os.getenv("LIST_CACHE_TTL_SECONDS", "300"))
+LIST_CACHE_DB = os.getenv("LIST_CACHE_DB")  # e.g. "list_cache.sqlite3", unset = memory only
+
+
+class ListCache:
+    def __init__(self, max_entries=LIST_CACHE_MAX_ENTRIES, ttl_seconds=LIST_CACHE_TTL_SECONDS, db_path=LIST_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()  # (collection, user_id, params) -> (expires_at, version, value)
+        self._versions = {}            # (collection, user_id) -> version, memory only mode
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.per_collection = {}       # collection -> {"hits", "misses"}
+        self._db_ready = False
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._init_db(conn)
+        return conn
+
+    def _init_db(self, conn):
+        # On the first connection rather than in __init__, so importing the module creates no files
+        if self._db_ready:
+            return
+        with self._db_lock:
+            if self._db_ready:
+                return
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS list_versions (collection TEXT, user_id TEXT, version INTEGER NOT NULL, "
+                    "PRIMARY KEY (collection, user_id))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS list_cache (key TEXT PRIMARY KEY, collection TEXT NOT NULL, user_id TEXT NOT NULL, "
+                    "version INTEGER NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS list_cache_owner ON list_cache (collection, user_id)")
+            self._db_ready = True
+
+    def version(self, collection, user_id):
+        if self.db_path:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT version FROM list_versions WHERE collection = ? AND user_id = ?", (collection, user_id)
+                ).fetchone()
+            return row[0] if row else 0
+        with self._lock:
+            return self._versions.get((collection, user_id), 0)
+
+    def get(self, collection, user_id, params):
+        """
+        Return the cached value for this page of the user's list, or None.
+        """
+        key = (collection, user_id, params)
+        version = self.version(collection, user_id)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now and entry[1] == version:
+                    self._entries.move_to_end(key)
+                    self._count(collection, "hits")
+                    return entry[2]
+                del self._entries[key]
+
+        if self.db_path:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM list_cache WHERE key = ? AND version = ?", (json.dumps(key), version)
+                ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store(key, row[1], version, value)
+                    self._count(collection, "hits")
+                return value
+
+        with self._lock:
+            self._count(collection, "misses")
+        return None
+
+    def set(self, collection, user_id, params, value, version):
+        """
+        Cache a page. 'version' is the one read before the query ran; if a write happened since, the page is dropped.
+        """
+        if self.version(collection, user_id) != version:
+            return
+        key = (collection, user_id, params)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, expires_at, version, value)
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO list_cache (key, collection, user_id, version, value, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (json.dumps(key), collection, user_id, version, json.dumps(value), expires_at),
+                )
+                conn.execute("DELETE FROM list_cache WHERE expires_at <= ?", (time.time(),))
+
+    def invalidate(self, collection, user_id):
+        """
+        Drop every cached page of one user's list, called by the route that wrote to it.
+        """
+        with self._lock:
+            self._versions[(collection, user_id)] = self._versions.get((collection, user_id), 0) + 1
+            for key in [key for key in self._entries if key[:2] == (collection, user_id)]:
+                del self._entries[key]
+            self.invalidations += 1
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT INTO list_versions (collection, user_id, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT (collection, user_id) DO UPDATE SET version = version + 1",
+                    (collection, user_id),
+                )
+                conn.execute("DELETE FROM list_cache WHERE collection = ? AND user_id = ?", (collection, user_id))
+
+    def _store(self, key, expires_at, version, value):
+        self._entries[key] = (expires_at, version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count(self, collection, field):
+        setattr(self, field, getattr(self, field) + 1)
+        counters = self.per_collection.setdefault(collection, {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "shared_backend": self.db_path,
+                "collections": {
+                    collection: {
+                        **counters,
+                        "hit_rate": counters["hits"] / (counters["hits"] + counters["misses"]),
+                    }
+                    for collection, counters in self.per_collection.items()
+                },
+            }
+
+
+list_cache = ListCache()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+LLM RESPONSE CACHE
+
+Responses are keyed by a hash of (model, normalized prompt) so resubmitting the same text skips the paid model call.
+'class LLMResponseCache' keeps an in-memory LRU with a TTL, and optionally a SQLite file that all workers on the box share
+'def normalize_prompt' collapses whitespace so cosmetic differences in the prompt still hit the same entry
+
+'''
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB")  # e.g. "llm_cache.sqlite3", unset = memory only
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+
+def cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS, db_path=LLM_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._db_ready = False
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        # WAL lets several uvicorn workers read while one of them writes
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._init_db(conn)
+        return conn
+
+    def _init_db(self, conn):
+        # On the first connection rather than in __init__, so importing the module creates no files
+        if self._db_ready:
+            return
+        with self._db_lock:
+            if self._db_ready:
+                return
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+            self._db_ready = True
+
+    def get(self, model: str, prompt: str):
+        """
+        Return the cached response for this model and prompt, or None on a miss or expired entry.
+        """
+        key = cache_key(model, prompt)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, model: str, prompt: str, response: str):
+        key = cache_key(model, prompt)
+        expires_at = time.time() + self.ttl_seconds
+
+        with self._lock:
+            self._store(key, response, expires_at)
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at),
+                )
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def _store(self, key, response, expires_at):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "shared_backend": self.db_path,
+            }
+
+
+llm_cache = LLMResponseCache()
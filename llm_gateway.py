@@ -0,0 +1,188 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from llm_cache import llm_cache
+
+load_dotenv()
+
+'''
+
+ASYNC LLM GATEWAY
+
+Every model call made by the routes goes through this module so that a slow completion never blocks the event loop.
+'def cohere_chat' and 'def openai_chat' use the async SDK clients, each provider has its own concurrency limit and timeout
+'def run_blocking' offloads sync SDK calls (LangChain embeddings, Pinecone queries) to a bounded thread pool
+'def cohere_chat_stream' and 'def openai_chat_stream' yield text deltas for the SSE routes
+'def get_cohere_client' and 'def get_openai_client' import the SDK and build the client on first use, so importing this
+module is cheap and doesn't need the API keys; 'def close_clients' is called by the app's lifespan on shutdown
+
+'''
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+COHERE_MAX_CONCURRENCY = int(os.getenv("COHERE_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+BLOCKING_MAX_WORKERS = int(os.getenv("BLOCKING_MAX_WORKERS", "16"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# One semaphore per provider so a burst of Cohere calls can't starve OpenAI (and vice versa)
+_limits = {
+    "cohere": asyncio.Semaphore(COHERE_MAX_CONCURRENCY),
+    "openai": asyncio.Semaphore(OPENAI_MAX_CONCURRENCY),
+    "blocking": asyncio.Semaphore(BLOCKING_MAX_WORKERS),
+}
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_MAX_WORKERS, thread_name_prefix="llm-gateway")
+
+
+def _client(provider, factory):
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _clients[provider] = factory()
+    return client
+
+
+def _cohere_client():
+    import cohere
+
+    api_key = os.getenv("COHERE_API_KEY")
+    if not api_key:
+        raise ValueError("COHERE_API_KEY not found in environment variables")
+    return cohere.AsyncClientV2(api_key=api_key, timeout=LLM_TIMEOUT_SECONDS)
+
+
+def _openai_client():
+    from openai import AsyncOpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment variables")
+    return AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT_SECONDS)
+
+
+def get_cohere_client():
+    return _client("cohere", _cohere_client)
+
+
+def get_openai_client():
+    return _client("openai", _openai_client)
+
+
+async def close_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None and asyncio.iscoroutinefunction(close):
+            await close()
+
+
+async def _limited(provider, awaitable, timeout=None):
+    async with _limits[provider]:
+        return await asyncio.wait_for(awaitable, timeout=timeout or LLM_TIMEOUT_SECONDS)
+
+
+async def cohere_chat(prompt, model="command-r7b-12-2024", timeout=None, use_cache=False) -> str:
+    """
+    Send a single user message to Cohere and return the text of the reply.
+    With use_cache=True an identical (model, prompt) pair is answered from the LLM response cache.
+    """
+    if use_cache:
+        cached = llm_cache.get(model, prompt)
+        if cached is not None:
+            return cached
+
+    res = await _limited(
+        "cohere",
+        get_cohere_client().chat(
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+        ),
+        timeout,
+    )
+    text = res.message.content[0].text if res.message.content else ""
+
+    if use_cache and text:
+        llm_cache.set(model, prompt, text)
+    return text
+
+
+async def openai_chat(messages, model="gpt-4o-mini", timeout=None) -> str:
+    """
+    Send a list of chat messages to OpenAI and return the text of the reply.
+    """
+    response = await _limited(
+        "openai",
+        get_openai_client().chat.completions.create(model=model, messages=messages),
+        timeout,
+    )
+    return response.choices[0].message.content
+
+
+async def run_blocking(fn, *args, timeout=None, **kwargs):
+    """
+    Run a synchronous function on the gateway thread pool without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await _limited(
+        "blocking",
+        loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs)),
+        timeout,
+    )
+
+
+async def _limited_stream(provider, stream, timeout=None):
+    # Hold the provider slot for the whole stream, the timeout applies to the gap between chunks
+    async with _limits[provider]:
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout or LLM_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                break
+            yield chunk
+
+
+async def cohere_chat_stream(prompt, model="command-r7b-12-2024", timeout=None):
+    """
+    Stream the reply to a single user message from Cohere, yielding text deltas as they arrive.
+    """
+    stream = get_cohere_client().chat_stream(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+    )
+    async for event in _limited_stream("cohere", stream, timeout):
+        if event.type == "content-delta":
+            yield event.delta.message.content.text
+
+
+async def openai_chat_stream(messages, model="gpt-4o-mini", timeout=None):
+    """
+    Stream the reply to a list of chat messages from OpenAI, yielding text deltas as they arrive.
+    """
+    stream = await _limited(
+        "openai",
+        get_openai_client().chat.completions.create(model=model, messages=messages, stream=True),
+        timeout,
+    )
+    async for chunk in _limited_stream("openai", stream, timeout):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
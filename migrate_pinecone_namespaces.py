@@ -0,0 +1,35 @@
+import argparse
+from vector_store import PineconeBackend
+
+'''
+
+MIGRATION: per-user Pinecone indexes -> namespaces in one shared index
+
+Copies each legacy index (named after a user id) into that user's namespace of PINECONE_SHARED_INDEX.
+Run it, switch the app to PINECONE_TENANCY=namespace, check that queries work, then re-run with --delete-old.
+
+    python migrate_pinecone_namespaces.py                      # every index except the shared one
+    python migrate_pinecone_namespaces.py hackhive some_user   # only these users
+    python migrate_pinecone_namespaces.py --delete-old
+
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("index_names", nargs="*")
+    parser.add_argument("--delete-old", action="store_true", help="delete each legacy index after it has been copied")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    backend = PineconeBackend(tenancy="namespace")
+    index_names = args.index_names or [name for name in backend.pc.list_indexes().names() if name != backend.shared_index]
+
+    for index_name in index_names:
+        copied = backend.migrate_index_to_namespace(index_name, batch_size=args.batch_size, delete_source=args.delete_old)
+        print(f"✅ {index_name}: {copied} vectors copied to namespace '{index_name}' of {backend.shared_index}"
+              + (" (legacy index deleted)" if args.delete_old else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+PDF TEXT EXTRACTION
+
+PyMuPDF text extraction is CPU-bound, so big documents are split into page ranges and extracted in a process pool.
+'def iter_page_texts' yields page texts in order, switching to the process pool above PARALLEL_EXTRACT_MIN_PAGES
+'def extract_serial' / 'def extract_parallel' are the two engines, kept separate so bench_pdf_extraction.py can compare them
+
+The pool starts its processes with "spawn" (EXTRACT_START_METHOD), not Linux's default fork: forking the API process, with
+uvicorn's loop, the gateway's thread pool and gRPC threads running, can leave a child stuck on a lock no thread will release.
+So this module must stay light to import, every pool process imports it on start; PyMuPDF itself is only imported by the
+functions that open a PDF, so the API process doesn't load it until the first upload.
+PyMuPDF isn't thread-safe, so the PyMuPDF calls made in this process (page counts, small documents) hold _fitz_lock.
+
+'''
+
+PARALLEL_EXTRACT_MIN_PAGES = int(os.getenv("PARALLEL_EXTRACT_MIN_PAGES", "64"))
+PAGES_PER_RANGE = int(os.getenv("PAGES_PER_RANGE", "16"))
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(os.cpu_count() or 1)))
+EXTRACT_START_METHOD = os.getenv("EXTRACT_START_METHOD", "spawn")
+
+_pool = None
+_pool_lock = threading.Lock()
+_fitz_lock = threading.Lock()
+
+
+def new_pool(max_workers=EXTRACT_PROCESSES):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(EXTRACT_START_METHOD))
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = new_pool()
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def page_count(pdf_path):
+    import fitz
+
+    with _fitz_lock, fitz.open(pdf_path) as pdf_document:
+        return len(pdf_document)
+
+
+def _extract_range(pdf_path, start, stop):
+    # Runs in a pool process; fitz documents can't be pickled, so each range reopens the file
+    import fitz
+
+    with fitz.open(pdf_path) as pdf_document:
+        return [pdf_document.load_page(page_number).get_text() for page_number in range(start, stop)]
+
+
+def extract_serial(pdf_path):
+    import fitz
+
+    # The lock is taken per page, not across the yield, so another upload's PyMuPDF calls aren't held up while this
+    # document's chunks are being embedded
+    with _fitz_lock:
+        pdf_document = fitz.open(pdf_path)
+        total_pages = len(pdf_document)
+    try:
+        for page_number in range(total_pages):
+            with _fitz_lock:
+                text = pdf_document.load_page(page_number).get_text()
+            yield text
+    finally:
+        with _fitz_lock:
+            pdf_document.close()
+
+
+def extract_parallel(pdf_path, total_pages=None, pages_per_range=PAGES_PER_RANGE, max_in_flight=2 * EXTRACT_PROCESSES, pool=None):
+    """
+    Yield page texts in page order while ranges are extracted in the process pool.
+    Only a couple of ranges per process are in flight at once, so memory stays bounded for huge documents.
+    """
+    pool = pool or _get_pool()
+    total_pages = page_count(pdf_path) if total_pages is None else total_pages
+    ranges = deque((start, min(start + pages_per_range, total_pages)) for start in range(0, total_pages, pages_per_range))
+    in_flight = deque()
+
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, stop = ranges.popleft()
+                in_flight.append(pool.submit(_extract_range, pdf_path, start, stop))
+            # Futures are consumed in submission order, which reassembles the document in page order
+            yield from in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_page_texts(pdf_path, total_pages=None):
+    total_pages = page_count(pdf_path) if total_pages is None else total_pages
+    if total_pages >= PARALLEL_EXTRACT_MIN_PAGES and EXTRACT_PROCESSES > 1:
+        return extract_parallel(pdf_path, total_pages)
+    return extract_serial(pdf_path)
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from event_extraction import parse_dates
+from scheduling import SCHEDULE_TIMEZONE
+
+load_dotenv()
+
+'''
+
+LOCAL TASK-PRIORITY CLASSIFIER
+
+Labels a task High, Medium or Low from keywords and how close its deadline is, without a model call.
+'def classify_priority' returns (label, confidence); every matched keyword adds its weight to one label, and a date in
+the task (parsed like event_extraction.py does, "by friday", "tomorrow", "March 5") adds weight by how many days are left.
+The confidence is the winning label's share of all the weight, so a task with no signal at all, or mixed ones, is ambiguous.
+'def classify_priorities' does the same for a list of tasks.
+'def normalize_priority' turns whatever the model answered into one of the three labels.
+features.py only asks command-r7b when the confidence is below PRIORITY_MIN_CONFIDENCE.
+
+'''
+
+PRIORITY_LABELS = ("High", "Medium", "Low")
+PRIORITY_MIN_CONFIDENCE = float(os.getenv("PRIORITY_MIN_CONFIDENCE", "0.6"))
+# Weight of a task that has at least some signal but nothing decisive, so one weak keyword isn't enough on its own
+PRIORITY_PRIOR = float(os.getenv("PRIORITY_PRIOR", "0.5"))
+
+# keyword or phrase -> (label, weight)
+PRIORITY_KEYWORDS = {
+    "High": {
+        "urgent": 3, "urgently": 3, "asap": 3, "immediately": 3, "emergency": 3, "critical": 3, "overdue": 3,
+        "right away": 3, "deadline": 2, "due": 2, "exam": 2, "final": 2, "finals": 2, "midterm": 2, "quiz": 1.5,
+        "test": 1.5, "submit": 2, "interview": 2, "important": 2, "must": 1.5, "pay rent": 2, "tonight": 2, "today": 2,
+        "doctor": 1.5, "medication": 2, "presentation": 1.5, "visa": 2, "tuition": 2,
+    },
+    "Medium": {
+        "assignment": 1.5, "homework": 1.5, "project": 1.5, "lab": 1.5, "report": 1.5, "essay": 1.5, "meeting": 1.5,
+        "appointment": 1.5, "study": 1, "review": 1, "prepare": 1, "practice": 1, "call": 1, "email": 1, "reply": 1,
+        "pay": 1, "bill": 1.5, "groceries": 1, "workout": 1, "gym": 1, "this week": 1.5, "should": 1, "lecture": 1,
+    },
+    "Low": {
+        "someday": 3, "eventually": 3, "whenever": 3, "no rush": 3, "not urgent": 4, "optional": 2.5, "maybe": 2,
+        "if i have time": 3, "when i have time": 3, "for fun": 2.5, "hobby": 2, "movie": 2, "watch": 1.5, "browse": 2,
+        "organize": 1.5, "clean": 1, "tidy": 1.5, "declutter": 2, "read a book": 1.5, "game": 1.5, "netflix": 2,
+        "later": 1.5, "next month": 2, "idea": 1.5, "look into": 1.5, "would be nice": 2.5,
+    },
+}
+
+# days left -> (label, weight), the first row whose limit is >= the days left applies
+DEADLINE_WEIGHTS = [(1, "High", 3), (3, "High", 2), (7, "Medium", 1.5), (21, "Medium", 1), (10 ** 6, "Low", 2)]
+
+_KEYWORDS = [
+    (re.compile(r"\b" + re.escape(keyword).replace(r"\ ", r"\s+") + r"\b", re.I), label, weight)
+    for label, keywords in PRIORITY_KEYWORDS.items()
+    for keyword, weight in keywords.items()
+]
+_NEGATED = re.compile(r"\b(?:not|no|isn't|is\s+not)\s+(?:that\s+|very\s+|super\s+)?(?:urgent|important|critical)\b", re.I)
+
+_stats_lock = threading.Lock()
+priority_stats = {"local": 0, "llm_fallbacks": 0, **{label: 0 for label in PRIORITY_LABELS}}
+
+
+def _scores(text, now=None):
+    scores = dict.fromkeys(PRIORITY_LABELS, 0.0)
+    # "not urgent" is a Low signal, its "urgent" must not count for High
+    text_without_negations = _NEGATED.sub(" no rush ", text)
+    for pattern, label, weight in _KEYWORDS:
+        if pattern.search(text_without_negations):
+            scores[label] += weight
+
+    week, _ = parse_dates(text, now)
+    if week is not None:
+        today = (now or datetime.now(ZoneInfo(SCHEDULE_TIMEZONE))).date()
+        days_left = (week[1] - today).days
+        for limit, label, weight in DEADLINE_WEIGHTS:
+            if days_left <= limit:
+                scores[label] += weight
+                break
+    return scores
+
+
+def classify_priority(text, now=None):
+    """
+    Return (label, confidence). With no signal the label is "Medium" and the confidence 0.
+    """
+    scores = _scores(text, now)
+    total = sum(scores.values())
+    if not total:
+        return "Medium", 0.0
+    # PRIORITY_LABELS order breaks ties towards the more urgent label
+    label = max(PRIORITY_LABELS, key=lambda name: scores[name])
+    return label, round(scores[label] / (total + PRIORITY_PRIOR), 2)
+
+
+def classify_priorities(texts, now=None):
+    """
+    classify_priority over a batch, same order, [(label, confidence), ...].
+    """
+    return [classify_priority(text, now) for text in texts]
+
+
+def normalize_priority(answer):
+    """
+    The first of High / Medium / Low the model's answer mentions ("**High** urgency.", "medium-priority"), Medium if none.
+    """
+    match = re.search(r"\b(high|medium|low|urgent)\b", answer or "", re.I)
+    if not match:
+        return "Medium"
+    word = match.group(1).lower()
+    return "High" if word == "urgent" else word.capitalize()
+
+
+def record_priority(label, source):
+    with _stats_lock:
+        priority_stats["local" if source == "local" else "llm_fallbacks"] += 1
+        priority_stats[label] += 1
+
+
+def priority_stats_snapshot():
+    with _stats_lock:
+        total = priority_stats["local"] + priority_stats["llm_fallbacks"]
+        return {
+            **priority_stats,
+            "local_rate": priority_stats["local"] / total if total else 0.0,
+            "min_confidence": PRIORITY_MIN_CONFIDENCE,
+        }
@@ -0,0 +1,176 @@
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+SCHEDULING ENGINE
+
+Finds when a task fits into the user's week without asking a model.
+'def get_available_slots' merges the busy calendar events in one sweep, walks every day from week_start to week_end inside
+working hours (in SCHEDULE_TIMEZONE), and returns the free windows plus every start time, SCHEDULE_STEP_MINUTES apart,
+where the task fits, ranked best first by 'def score_candidate'.
+Scoring is deterministic: the same calendar and request always give the same answer, and the top candidate is what
+provideDates (features.py) returns unless the LLM picker is switched on.
+
+'''
+
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "America/Toronto")
+# Calendar times without an offset are in this zone (the Logic App returns Outlook times in UTC)
+CALENDAR_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "UTC")
+WORKDAY_START = os.getenv("WORKDAY_START", "08:00")
+WORKDAY_END = os.getenv("WORKDAY_END", "22:00")
+SCHEDULE_STEP_MINUTES = int(os.getenv("SCHEDULE_STEP_MINUTES", "30"))
+SCHEDULE_MAX_CANDIDATES = int(os.getenv("SCHEDULE_MAX_CANDIDATES", "20"))
+# Candidates this close to a busy event lose points, back-to-back blocks are tiring
+SCHEDULE_BUFFER_MINUTES = int(os.getenv("SCHEDULE_BUFFER_MINUTES", "30"))
+SCHEDULE_PREFERRED_TIME = os.getenv("SCHEDULE_PREFERRED_TIME", "14:00")
+# Let command-r-plus choose among the top candidates instead of taking the top one (slower, not deterministic)
+SCHEDULE_LLM_PICKER = os.getenv("SCHEDULE_LLM_PICKER", "false").lower() == "true"
+
+# Weights of the scoring function, each term is between 0 and 1
+SCORE_WEIGHTS = {"soon": 0.35, "light_day": 0.25, "buffer": 0.25, "preferred_time": 0.15}
+
+# Outlook sends 7 fractional digits, fromisoformat only takes up to 6
+_EXTRA_FRACTION = re.compile(r"(\.\d{6})\d+")
+
+
+def parse_calendar_time(value, default_zone=None):
+    parsed = datetime.fromisoformat(_EXTRA_FRACTION.sub(r"\1", value.replace("Z", "+00:00")))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=default_zone or ZoneInfo(CALENDAR_TIMEZONE))
+    return parsed
+
+
+def merge_intervals(intervals):
+    """
+    Sort and sweep (start, end) pairs into non-overlapping busy blocks.
+    """
+    merged = []
+    for start, end in sorted(interval for interval in intervals if interval[1] > interval[0]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_windows(window_start, window_end, busy):
+    """
+    The parts of [window_start, window_end) not covered by the merged busy blocks.
+    """
+    windows = []
+    cursor = window_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            windows.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < window_end:
+        windows.append((cursor, window_end))
+    return windows
+
+
+def score_candidate(start, end, day_index, day_count, day_busy_fraction, busy, preferred_start):
+    """
+    Higher is better. Sooner days, lighter days, room around other events and closeness to the preferred time all count.
+    """
+    gap_before = min((start - busy_end for _, busy_end in busy if busy_end <= start), default=None)
+    gap_after = min((busy_start - end for busy_start, _ in busy if busy_start >= end), default=None)
+    gaps = [gap for gap in (gap_before, gap_after) if gap is not None]
+    buffer = min(min(gaps) / timedelta(minutes=SCHEDULE_BUFFER_MINUTES), 1.0) if gaps and SCHEDULE_BUFFER_MINUTES else 1.0
+
+    distance_hours = abs((start - preferred_start) / timedelta(hours=1))
+    terms = {
+        "soon": 1.0 - day_index / max(day_count, 1),
+        "light_day": 1.0 - day_busy_fraction,
+        "buffer": buffer,
+        "preferred_time": max(1.0 - distance_hours / 12.0, 0.0),
+    }
+    return sum(SCORE_WEIGHTS[name] * value for name, value in terms.items())
+
+
+def _week(week_start, week_end, today):
+    try:
+        first = date.fromisoformat(week_start) if week_start else today
+        last = date.fromisoformat(week_end) if week_end else first + timedelta(days=6)
+    except (TypeError, ValueError):
+        first, last = today, today + timedelta(days=6)
+    if last < first:
+        first, last = last, first
+    return max(first, today), last
+
+
+def _slot(start, end, **extra):
+    return {"date": start.date().isoformat(), "start_time": start.strftime("%H:%M"), "end_time": end.strftime("%H:%M"), **extra}
+
+
+def get_available_slots(unavailable_times, duration_hours, week_start=None, week_end=None, now=None, max_candidates=SCHEDULE_MAX_CANDIDATES):
+    """
+    unavailable_times is the Logic App response, {"events": [{"Start": iso, "End": iso}, ...]}.
+    Returns {"available_times": free windows long enough for the task, "candidates": ranked start times, best first}.
+    """
+    zone = ZoneInfo(SCHEDULE_TIMEZONE)
+    now = (now or datetime.now(zone)).astimezone(zone)
+    duration = timedelta(hours=float(duration_hours))
+    step = timedelta(minutes=SCHEDULE_STEP_MINUTES)
+    day_start, day_end = time.fromisoformat(WORKDAY_START), time.fromisoformat(WORKDAY_END)
+    preferred = time.fromisoformat(SCHEDULE_PREFERRED_TIME)
+
+    busy = merge_intervals(
+        (parse_calendar_time(event["Start"]).astimezone(zone), parse_calendar_time(event["End"]).astimezone(zone))
+        for event in (unavailable_times or {}).get("events") or []
+    )
+
+    first_day, last_day = _week(week_start, week_end, now.date())
+    day_count = (last_day - first_day).days + 1
+    available, candidates = [], []
+    for day_index in range(day_count):
+        day = first_day + timedelta(days=day_index)
+        window_start = datetime.combine(day, day_start, zone)
+        window_end = datetime.combine(day, day_end, zone)
+        preferred_start = datetime.combine(day, preferred, zone)
+
+        busy_today = [(max(start, window_start), min(end, window_end)) for start, end in busy if start < window_end and end > window_start]
+        day_busy_fraction = sum((end - start for start, end in busy_today), timedelta()) / (window_end - window_start)
+
+        for free_start, free_end in free_windows(window_start, window_end, busy):
+            # Candidate starts sit on the step grid of the working day, plus the end of a busy event
+            # (the moment a lecture ends is a good start), but nothing earlier than now
+            starts = [free_start] if free_start >= now else []
+            earliest = max(free_start, now)
+            offset = (earliest - window_start) % step
+            start = earliest if not offset else earliest + (step - offset)
+            first = starts[0] if starts else start
+            if free_end - first < duration:
+                continue
+            available.append(_slot(first, free_end))
+            if starts and start == free_start:
+                start += step
+            while start + duration <= free_end:
+                starts.append(start)
+                start += step
+            for start in starts:
+                score = score_candidate(start, start + duration, day_index, day_count, day_busy_fraction, busy, preferred_start)
+                candidates.append((score, start))
+
+    # Ties go to the earliest start, so the ranking never depends on anything but the input
+    candidates.sort(key=lambda candidate: (-round(candidate[0], 9), candidate[1]))
+    return {
+        "available_times": available,
+        "candidates": [_slot(start, start + duration, score=round(score, 4)) for score, start in candidates[:max_candidates]],
+    }
+
+
+def best_slot(available_slots):
+    candidates = available_slots.get("candidates") or []
+    if not candidates:
+        return None
+    return {field: candidates[0][field] for field in ("date", "start_time", "end_time")}
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+import document_registry
+
+load_dotenv()
+
+'''
+
+SEMANTIC ANSWER CACHE
+
+Sits in front of generate_rag_answer, scoped per index_name (one user's corpus) and retrieval mode.
+'def lookup' compares the query embedding against the user's cached queries and returns the stored answer above the threshold
+'def store' saves an answer, but only if the user's corpus hasn't changed since the answer was computed
+'def invalidate' drops everything for a user, it is called whenever add_new_pdf or delete_pinecone_index touches their corpus
+The entries live in this process, but the corpus version is kept in the document registry's SQLite file, so an upload
+ingested by another worker process also makes this process's answers for that user stale.
+
+'''
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))  # per index_name and mode
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # (index_name, mode) -> {"version": corpus version, "vectors": ndarray (n, d), "answers": [...], "queries": [...], "expires": [...]}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, index_name):
+        return document_registry.corpus_version(index_name)
+
+    def lookup(self, index_name, query_embedding, mode=None, version=None):
+        """
+        Return the cached answer for the most similar earlier query, or None if nothing is above the threshold.
+        Answers computed against an older version of the corpus are dropped instead.
+        """
+        vector = _unit(query_embedding)
+        version = self.version(index_name) if version is None else version
+        now = time.time()
+
+        with self._lock:
+            bucket = self._entries.get((index_name, mode))
+            if bucket is not None and bucket["version"] != version:
+                del self._entries[(index_name, mode)]
+                bucket = None
+            if bucket is not None and len(bucket["answers"]):
+                scores = bucket["vectors"] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold and bucket["expires"][best] > now:
+                    self.hits += 1
+                    return bucket["answers"][best]
+            self.misses += 1
+            return None
+
+    def store(self, index_name, query, query_embedding, answer, version, mode=None):
+        """
+        Cache an answer. 'version' is the corpus version read before retrieval; a stale answer is dropped.
+        """
+        if self.version(index_name) != version:
+            return
+        vector = _unit(query_embedding)
+
+        with self._lock:
+            bucket = self._entries.get((index_name, mode))
+            if bucket is None or bucket["version"] != version:
+                bucket = self._entries[(index_name, mode)] = {
+                    "version": version,
+                    "vectors": np.empty((0, vector.shape[0]), dtype=np.float32),
+                    "answers": [],
+                    "queries": [],
+                    "expires": [],
+                }
+            bucket["vectors"] = np.vstack([bucket["vectors"], vector[None, :]])[-self.max_entries:]
+            bucket["answers"] = (bucket["answers"] + [answer])[-self.max_entries:]
+            bucket["queries"] = (bucket["queries"] + [query])[-self.max_entries:]
+            bucket["expires"] = (bucket["expires"] + [time.time() + self.ttl_seconds])[-self.max_entries:]
+
+    def invalidate(self, index_name):
+        document_registry.bump_corpus_version(index_name)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == index_name]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "users": len({index_name for index_name, _ in self._entries}),
+                "entries": sum(len(bucket["answers"]) for bucket in self._entries.values()),
+                "threshold": self.threshold,
+            }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+semantic_cache = SemanticCache()
@@ -1,87 +1,167 @@
 import os
-from langchain_pinecone import PineconeVectorStore
-from openai import OpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Pinecone
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pinecone.grpc import PineconeGRPC as Pinecone
-import fitz
+import asyncio
+import threading
+import uuid
 from dotenv import load_dotenv
-from pinecone import ServerlessSpec
+from llm_gateway import openai_chat, openai_chat_stream, run_blocking
+from semantic_cache import semantic_cache
+from pdf_extraction import iter_page_texts, page_count
+from chunking import split_pages
+from embedding_engine import IngestionEngine
+from vector_store import get_vector_store
+from context_builder import build_context, context_stats
+import bm25_index
+import document_registry
+from embedding_cache import embedding_cache
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
-PINECONE_ENV = os.getenv('PINECONE_ENV')
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-embeddings = OpenAIEmbeddings(openai_api_key = OPENAI_API_KEY, model='text-embedding-ada-002')
-client = OpenAI()
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+
+# "vector" (embedding similarity), "lexical" (local BM25, no embedding call) or "hybrid" (both, fused with RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+LEXICAL_BATCH_SIZE = 256
+
+# The vector store (Pinecone by default, VECTOR_STORE=local keeps vectors on disk instead, see vector_store.py) and the
+# OpenAI embeddings client are only built on first use, so importing this module neither loads LangChain nor needs the keys
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+
+                _embeddings = OpenAIEmbeddings(openai_api_key = OPENAI_API_KEY, model=EMBEDDING_MODEL)
+    return _embeddings
 
 def main():
     pass
     # delete_pinecone_index('hackhive')
     # write_pinecone_index('hackhive')
-    # write_to_text()
 
     # add_new_pdf('stats.pdf', 'hackhive')
 
     query= "What textbook is recommended for stats course?"
-    print(generate_rag_answer(query, 'hackhive'))
+    print(asyncio.run(generate_rag_answer(query, 'hackhive')))
 
 '''
 
 WRITING INTO PINECONE FUNCTIONS
 
-'def add_new_pdf' doesn't do anything itself, but instead calls a series of functions
-'write_to_text' will retrieve a pdf path and write the text into document.txt which will be overwritten each time
-'write_pinecone_index' will create a new index if it doesn't exist, and then upload the text from document.txt into the Pinecone index
+'def add_new_pdf' doesn't do anything itself, but instead chains the functions below into one streaming pipeline
+              (a file identical to one of the user's documents is skipped before it is even parsed)
+'iter_pdf_pages' yields the text of one page at a time, so the whole PDF is never held in memory or written to disk
+           (big PDFs are extracted in parallel page ranges by pdf_extraction.py)
+'split_pages' (chunking.py) turns the pages into (chunk, {"page": n}) pairs with the configured CHUNK_STRATEGY
+'write_pinecone_index' will create a new index if it doesn't exist, and then hands the chunks to the batched embedding/upsert engine
+                       (the chunks are added to the user's BM25 index on the way through)
+                       Chunk ids are "<document_id>:<content hash>", so replacing a document only re-embeds the chunks that changed
+                       Vectors come through embedding_cache.py, so text any user has uploaded before costs no embedding call
+
+Everything is local to the call, so two concurrent uploads can never see each other's text.
 
 '''
 
-def add_new_pdf(pdf_path, index_name):
-    write_to_text(pdf_path)
-    write_pinecone_index(index_name)
-
-def write_to_text(pdf_path):
-    pdf_document = fitz.open(pdf_path) 
-
-    with open("document.txt", "w", encoding="utf-8", errors="replace") as text_file:
-        for page_number in range(len(pdf_document)):
-            page = pdf_document.load_page(page_number)
-            text = page.get_text()
-            text_file.write(text + "\n")
-
-    pdf_document.close()
-
-def write_pinecone_index(index_name):
-    if index_name not in pc.list_indexes().names():
-        pc.create_index(
-            name=index_name,
-            dimension=1536,
-            metric='euclidean',
-            spec=ServerlessSpec(
-                cloud='aws',
-                region=PINECONE_ENV
-            )
+def add_new_pdf(pdf_path, index_name, progress=None, source=None, document_id=None):
+    # progress(field, amount) is optional, the ingestion job queue uses it to report how far along an upload is
+    # A new document gets a random id, so an upload never replaces another document (one with the same name, or one
+    # that was since replaced with another file); only an explicit document_id (the replace route) replaces a document
+    source = source or os.path.basename(pdf_path)
+    file_hash = document_registry.file_hash(pdf_path)
+    duplicate_id = document_registry.find_by_file_hash(index_name, file_hash)
+    if duplicate_id and document_id in (None, duplicate_id):
+        embedding_cache.record_deduplicated_upload()
+        print(f"Document {source} is identical to '{duplicate_id}' in {index_name}, nothing to do.")
+        return duplicate_id
+
+    document_id = document_id or uuid.uuid4().hex
+    try:
+        return write_pinecone_index(
+            index_name, split_pages(iter_pdf_pages(pdf_path, progress)), progress, source, document_id, file_hash
         )
-
-    file_data = open('document.txt', 'r', encoding="utf-8")
-    file_content = file_data.read()
-
-    # (the bigger the chunk_size, the context can get lost, overlap between chunks can help context)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=500
-    )
-
-    # Using the properties of text_splitter, split the entire text into smaller vectors
-    doc_splits = text_splitter.create_documents([file_content])
-
-    # Upload to VectorDB
-    docsearch = Pinecone.from_documents(doc_splits, embeddings, index_name = index_name)
-    print(f"Document has been added in {index_name}.")
+    finally:
+        # The user's corpus changed, cached answers may no longer be right
+        semantic_cache.invalidate(index_name)
+
+def iter_pdf_pages(pdf_path, progress=None):
+    total_pages = page_count(pdf_path)
+    if progress:
+        progress("pages_total", total_pages)
+
+    # Large documents are extracted in a process pool (see pdf_extraction.py), pages still arrive in order
+    for text in iter_page_texts(pdf_path, total_pages):
+        yield text + "\n"
+        if progress:
+            progress("pages_parsed", 1)
+
+def write_pinecone_index(index_name, chunks, progress=None, source=None, document_id=None, file_hash=None):
+    get_vector_store().ensure_index(index_name, dimension=1536)
+    document_id = document_id or uuid.uuid4().hex
+
+    # Chunks already stored for this document under the same content hash are kept as they are, not re-embedded
+    existing_chunks = document_registry.get_chunks(index_name, document_id)
+    existing_chunk_ids = set(existing_chunks)
+    document_chunks = []
+
+    # Upload to VectorDB: batched embedding, parallel upserts, failed batches retried on their own (see embedding_engine.py)
+    embedder = embedding_cache.cached(get_embeddings().embed_documents, EMBEDDING_MODEL)
+    engine = IngestionEngine(embedder, lambda records: get_vector_store().upsert(index_name, records))
+    records = _chunk_records(chunks, document_id, source, existing_chunks, document_chunks)
+    stats = engine.run(_index_lexically(index_name, records), progress=progress)
+
+    # Chunks of the previous version that no longer exist in the new one
+    stale_chunk_ids = existing_chunk_ids - {chunk_id for chunk_id, _, _ in document_chunks}
+    if stale_chunk_ids:
+        get_vector_store().delete(index_name, ids=stale_chunk_ids)
+        bm25_index.delete_chunks(index_name, stale_chunk_ids)
+    document_registry.save_document(index_name, document_id, source, document_chunks, file_hash)
+
+    print(f"Document {source or document_id} has been added in {index_name} "
+          f"({stats['vectors_upserted']} chunks embedded, {len(document_chunks) - stats['chunks']} unchanged, "
+          f"{len(stale_chunk_ids)} removed, {stats['chunks_per_sec']:.1f} chunks/s).")
+    return document_id
+
+def _chunk_records(chunks, document_id, source, existing_chunks, document_chunks):
+    # Gives every chunk a stable id "<document_id>:<content hash>" plus metadata, and skips chunks that are already stored
+    # with the same page and previous chunk; an unchanged chunk whose neighbour moved is upserted again (its embedding
+    # comes from embedding_cache.py) so context_builder.py never stitches it to a chunk that is no longer next to it
+    occurrences = {}
+    previous_chunk_id = None
+    for chunk in chunks:
+        text, chunk_metadata = chunk if isinstance(chunk, tuple) else (chunk, {})
+        chunk_hash = document_registry.content_hash(text)
+        occurrences[chunk_hash] = occurrences.get(chunk_hash, 0) + 1
+        chunk_id = f"{document_id}:{chunk_hash}" + (f":{occurrences[chunk_hash]}" if occurrences[chunk_hash] > 1 else "")
+
+        # Pinecone metadata can't hold nulls, so optional fields are left out instead
+        metadata = {"document_id": document_id, "chunk_id": chunk_id, "content_hash": chunk_hash}
+        metadata.update({key: value for key, value in chunk_metadata.items() if value is not None})
+        if source:
+            metadata["source"] = source
+        if previous_chunk_id:
+            metadata["previous_chunk_id"] = previous_chunk_id
+
+        document_chunks.append((chunk_id, metadata.get("page"), chunk_hash))
+        if existing_chunks.get(chunk_id) != (metadata.get("page"), previous_chunk_id):
+            yield chunk_id, text, metadata
+        previous_chunk_id = chunk_id
+
+def _index_lexically(index_name, records):
+    # Feed the BM25 index in batches as records stream past, using the same ids as the vectors
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= LEXICAL_BATCH_SIZE:
+            bm25_index.add_chunks(index_name, batch)
+            batch = []
+        yield record
+    bm25_index.add_chunks(index_name, batch)
 
 
 
@@ -89,16 +169,28 @@ def write_pinecone_index(index_name):
 
 DELETE FUNCTION
 
-'def delete_pinecone_index' deletes all the vectors within a PineconeDB
+'def delete_pinecone_index' deletes all the vectors within a PineconeDB (or the local store, see vector_store.py)
+'def delete_document' deletes only the chunks of one document, using the ids recorded in document_registry.py
 
 '''
 
 
 def delete_pinecone_index(index_name):
-    index = PineconeVectorStore(index_name=index_name, embedding=embeddings)
-    index.delete(delete_all=True)
+    get_vector_store().delete(index_name, delete_all=True)
+    bm25_index.clear(index_name)
+    document_registry.clear_user(index_name)
+    semantic_cache.invalidate(index_name)
     print(f"All vectors in '{index_name}' have been deleted.")
 
+def delete_document(index_name, document_id):
+    chunk_ids = document_registry.delete_document(index_name, document_id)
+    if chunk_ids:
+        get_vector_store().delete(index_name, ids=chunk_ids)
+        bm25_index.delete_chunks(index_name, chunk_ids)
+    semantic_cache.invalidate(index_name)
+    print(f"Document '{document_id}' ({len(chunk_ids)} chunks) has been deleted from '{index_name}'.")
+    return len(chunk_ids)
+
 
 
 '''
@@ -106,37 +198,105 @@ def delete_pinecone_index(index_name):
 QUERY FUNCTIONS
 
 'def generate_rag_answer' deletes all the vectors within a PineconeDB and calls upon all the other functions, eventually using all the other functions and creating a template for RAG
-'def retrieve_query' embeds the user's query and returns the top 15 similar vectors
+'def stream_rag_answer' does the same as generate_rag_answer but yields the answer token by token as OpenAI streams it
+Both check the per-user semantic cache (semantic_cache.py) first, so a reworded question about unchanged notes is answered without retrieval
+'def retrieve_query' embeds the user's query and returns the top 15 similar vectors (or reuses a precomputed query embedding)
+                   mode='lexical' searches the local BM25 index instead, mode='hybrid' fuses both (see bm25_index.py)
 'def format_rag_prompt' formats the retrieved chunks as context and the user's query into a prompt for the RAG model
+                      (deduplicated, overlap-merged and token-budgeted by context_builder.py)
 
 '''
 
-def generate_rag_answer(query, index_name):
-    retrieved_chunks = retrieve_query(query, 15, index_name)
-    prompt = format_rag_prompt(query, retrieved_chunks)
-
-    response = client.chat.completions.create(
-    model="gpt-4o-mini",
-    messages = [
+async def generate_rag_answer(query, index_name, mode=None):
+    # Resolved here too, cached answers are kept per retrieval mode
+    mode = mode or RETRIEVAL_MODE
+    version, query_embedding, cached_answer, prompt = await _prepare_rag(query, index_name, mode)
+    if cached_answer is not None:
+        return cached_answer
+
+    answer = await openai_chat(rag_messages(prompt), model="gpt-4o-mini")
+    if query_embedding is not None:
+        await run_blocking(semantic_cache.store, index_name, query, query_embedding, answer, version, mode)
+    return answer
+
+async def stream_rag_answer(query, index_name, mode=None):
+    # Resolved here too, cached answers are kept per retrieval mode
+    mode = mode or RETRIEVAL_MODE
+    version, query_embedding, cached_answer, prompt = await _prepare_rag(query, index_name, mode)
+    if cached_answer is not None:
+        yield cached_answer
+        return
+
+    tokens = []
+    async for token in openai_chat_stream(rag_messages(prompt), model="gpt-4o-mini"):
+        tokens.append(token)
+        yield token
+    if query_embedding is not None:
+        await run_blocking(semantic_cache.store, index_name, query, query_embedding, "".join(tokens), version, mode)
+
+async def _prepare_rag(query, index_name, mode):
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+
+    # Read the corpus version before retrieval so an answer computed during an upload is never cached
+    # (it is shared between worker processes in SQLite, see semantic_cache.py)
+    version = await run_blocking(semantic_cache.version, index_name)
+
+    # Lexical mode never talks to the embedding provider, so it also skips the (embedding-keyed) semantic cache
+    query_embedding = None
+    if mode != "lexical":
+        # The embedding call and Pinecone query are sync SDK calls, so they run on the gateway thread pool
+        query_embedding = await run_blocking(get_embeddings().embed_query, query)
+        cached_answer = semantic_cache.lookup(index_name, query_embedding, mode, version)
+        if cached_answer is not None:
+            return version, query_embedding, cached_answer, None
+
+    retrieved_chunks = await run_blocking(retrieve_query, query, 15, index_name, query_embedding, mode)
+    return version, query_embedding, None, format_rag_prompt(query, retrieved_chunks)
+
+def rag_messages(prompt):
+    return [
         {"role": "system", "content": "You are an AI assistant that answers queries based on retrieved documents. "
                                     "If you don't know the answer, please respond with: "
                                     "'Unfortunately, either what you're asking for doesn't exist or I don't quite understand the question. Can you please reword what you're asking?'"},
         {"role": "user", "content": prompt}
     ]
 
-    )
-
-    return response.choices[0].message.content
-
-def retrieve_query(query, k, index_name):
-    index = PineconeVectorStore(index_name=index_name, embedding=embeddings)
-    matching_results = index.similarity_search(query, k=k)
+def retrieve_query(query, k, index_name, query_embedding=None, mode=None):
+    mode = mode or RETRIEVAL_MODE
+    if mode == "lexical":
+        matches = bm25_index.search(index_name, query, k)
+    else:
+        # Reuse the embedding if the caller already computed it (e.g. for the semantic cache)
+        if query_embedding is None:
+            query_embedding = get_embeddings().embed_query(query)
+        if mode == "hybrid":
+            # Over-fetch from both retrievers so fusion has something to re-rank
+            matches = bm25_index.reciprocal_rank_fusion(
+                get_vector_store().query(index_name, query_embedding, 2 * k),
+                bm25_index.search(index_name, query, 2 * k),
+            )[:k]
+        else:
+            matches = get_vector_store().query(index_name, query_embedding, k)
+
+    from langchain_core.documents import Document
+
+    matching_results = []
+    for match in matches:
+        metadata = dict(match["metadata"])
+        text = metadata.pop("text", "")
+        matching_results.append(Document(page_content=text, metadata=metadata))
     return matching_results
 
 def format_rag_prompt(query, retrieved_chunks):
+    # Merge overlapping chunks, drop duplicates and pack to the token budget (see context_builder.py)
+    context, report = build_context(retrieved_chunks)
+    print(f"RAG context: {report['chunks_in']} chunks -> {report['passages_out']} passages, {report['tokens_saved']} tokens saved.")
+
     prompt = f"""Use the following context to answer the question:
 
-    {retrieved_chunks}
+    {context}
 
     Question: {query}
 
@@ -0,0 +1,530 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows, see file_lock
+    fcntl = None
+
+load_dotenv()
+
+'''
+
+VECTOR STORE BACKENDS
+
+vector_rag.py talks to the vector database only through this interface, so the RAG path can run without Pinecone.
+Every backend has the same four methods, with records as (id, values, metadata) and matches as {"id", "score", "metadata"}:
+'ensure_index(index_name, dimension)'  create the user's index if it doesn't exist yet
+'upsert(index_name, records)'          insert or overwrite vectors
+'query(index_name, vector, k)'         top-k matches, best first
+'delete(index_name, ids, delete_all)'  remove some or all vectors
+
+'class PineconeBackend' is hosted Pinecone, either one serverless index per user or one shared index with a namespace per user
+'class LocalBackend' keeps each user's vectors on disk in LOCAL_VECTOR_DIR: a memory-mapped float32 matrix searched exactly
+for small corpora, plus an IVF (inverted file) approximate index that is built once a corpus passes LOCAL_ANN_MIN_VECTORS
+                   (writers in different worker processes take an flock on the index's lock file, see file_lock)
+'def get_vector_store' picks the backend from the VECTOR_STORE env variable ("pinecone" or "local")
+
+'''
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+PINECONE_TENANCY = os.getenv("PINECONE_TENANCY", "index")  # "index" = one index per user, "namespace" = one shared index
+PINECONE_SHARED_INDEX = os.getenv("PINECONE_SHARED_INDEX", "nexus-shared")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "vector_data")
+LOCAL_ANN_MIN_VECTORS = int(os.getenv("LOCAL_ANN_MIN_VECTORS", "50000"))
+LOCAL_ANN_NPROBE = int(os.getenv("LOCAL_ANN_NPROBE", "10"))
+# Rebuild the IVF lists once this fraction of rows has been added since the last build
+LOCAL_ANN_REBUILD_GROWTH = float(os.getenv("LOCAL_ANN_REBUILD_GROWTH", "0.2"))
+# Rewrite the files once this fraction of rows is dead (deleted or overwritten)
+LOCAL_COMPACT_DEAD_FRACTION = float(os.getenv("LOCAL_COMPACT_DEAD_FRACTION", "0.3"))
+HANDLE_POOL_SIZE = int(os.getenv("HANDLE_POOL_SIZE", "64"))
+HANDLE_IDLE_SECONDS = float(os.getenv("HANDLE_IDLE_SECONDS", "900"))
+
+def index_path(root, index_name):
+    """
+    Directory of a user's on-disk index. The name is the user id from the request, so every character other than
+    letters, digits, '-' and '_' is percent-encoded ("a.b@x.com" -> "a%2Eb%40x%2Ecom", "../x" -> "%2E%2E%2Fx"):
+    any id is accepted, none can step out of root, and two ids never share a directory.
+    """
+    if not index_name:
+        raise ValueError("Index name must not be empty")
+    return os.path.join(root, quote(index_name, safe="").replace(".", "%2E").replace("~", "%7E"))
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    flock on path (created if missing), so the on-disk indexes can be shared by several uvicorn workers on one box.
+    Without fcntl (Windows) this does nothing, and the local backends are then only safe within one process.
+    Not re-entrant, even within a thread: take it once, in the public method.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class HandlePool:
+    """
+    Keeps warm index handles (Pinecone gRPC clients, loaded local indexes) keyed by index name.
+    Least recently used handles are evicted past max_size, and handles idle for idle_seconds are dropped on the next access.
+    The handles themselves must be thread-safe; the pool only guards its own bookkeeping.
+    Evicted handles are not closed explicitly, another thread may still be mid-request on one; they close when collected.
+    """
+
+    def __init__(self, factory, max_size=HANDLE_POOL_SIZE, idle_seconds=HANDLE_IDLE_SECONDS):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._handles = OrderedDict()  # key -> (handle, last_used)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is not None:
+                self.hits += 1
+                handle = entry[0]
+                self._handles[key] = (handle, now)
+                self._handles.move_to_end(key)
+            else:
+                self.misses += 1
+                handle = None
+
+            while self._handles:
+                oldest_key, (_, last_used) = next(iter(self._handles.items()))
+                if len(self._handles) < self.max_size + (handle is not None) and now - last_used < self.idle_seconds:
+                    break
+                del self._handles[oldest_key]
+                self.evictions += 1
+
+        if handle is not None:
+            return handle
+
+        # Build outside the lock, client construction is the slow part we are pooling
+        handle = self.factory(key)
+        with self._lock:
+            existing = self._handles.get(key)
+            if existing is not None:
+                handle = existing[0]
+            self._handles[key] = (handle, time.monotonic())
+            self._handles.move_to_end(key)
+        return handle
+
+    def discard(self, key):
+        with self._lock:
+            self._handles.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._handles),
+                "max_size": self.max_size,
+                "idle_seconds": self.idle_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "keys": list(self._handles.keys()),
+            }
+
+
+
+
+class PineconeBackend:
+    """
+    With PINECONE_TENANCY=index (the original layout) every user gets a serverless index named after their user id.
+    With PINECONE_TENANCY=namespace every user is a namespace inside one shared index, PINECONE_SHARED_INDEX,
+    which avoids per-project index quotas and the create-index round trip for new users.
+    Index names we have already seen are cached in-process, so list_indexes() is only called for unknown names.
+    """
+
+    def __init__(self, api_key=None, region=None, tenancy=None, shared_index=None):
+        from pinecone.grpc import PineconeGRPC as Pinecone
+
+        self.pc = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"))
+        self.region = region or os.getenv("PINECONE_ENV")
+        self.tenancy = tenancy or PINECONE_TENANCY
+        self.shared_index = shared_index or PINECONE_SHARED_INDEX
+        self._known_indexes = set()
+        self._lock = threading.Lock()
+        # pc.Index(name) resolves the index host and opens a gRPC channel, so handles are reused across requests
+        self.handles = HandlePool(self.pc.Index)
+
+    def _target(self, index_name):
+        # (physical Pinecone index, namespace) for a user's logical index
+        if self.tenancy == "namespace":
+            return self.shared_index, index_name
+        return index_name, None
+
+    def _ensure_physical_index(self, name, dimension):
+        from pinecone import ServerlessSpec
+
+        with self._lock:
+            if name in self._known_indexes:
+                return
+            self._known_indexes.update(self.pc.list_indexes().names())
+            if name in self._known_indexes:
+                return
+            self.pc.create_index(
+                name=name,
+                dimension=dimension,
+                metric='euclidean',
+                spec=ServerlessSpec(
+                    cloud='aws',
+                    region=self.region
+                )
+            )
+            self._known_indexes.add(name)
+
+    def ensure_index(self, index_name, dimension=1536):
+        # Namespaces need no setup, they appear on first upsert
+        self._ensure_physical_index(self._target(index_name)[0], dimension)
+
+    def upsert(self, index_name, records):
+        name, namespace = self._target(index_name)
+        self.handles.get(name).upsert(vectors=records, namespace=namespace)
+
+    def query(self, index_name, vector, k):
+        name, namespace = self._target(index_name)
+        result = self.handles.get(name).query(vector=list(vector), top_k=k, include_metadata=True, namespace=namespace)
+        return [{"id": match["id"], "score": match["score"], "metadata": match["metadata"] or {}} for match in result["matches"]]
+
+    def delete(self, index_name, ids=None, delete_all=False):
+        name, namespace = self._target(index_name)
+        if delete_all:
+            self.handles.get(name).delete(delete_all=True, namespace=namespace)
+        elif ids:
+            self.handles.get(name).delete(ids=list(ids), namespace=namespace)
+
+    def stats(self):
+        return {"backend": "pinecone", "tenancy": self.tenancy, "handles": self.handles.stats()}
+
+    def migrate_index_to_namespace(self, index_name, batch_size=100, delete_source=False):
+        """
+        Copy every vector of a legacy per-user index into the user's namespace of the shared index.
+        Safe to re-run (upserts overwrite by id). The source index is only deleted when delete_source=True.
+        """
+        source = self.handles.get(index_name)
+        dimension = self.pc.describe_index(index_name).dimension
+        self._ensure_physical_index(self.shared_index, dimension)
+        target = self.handles.get(self.shared_index)
+
+        copied = 0
+        for id_page in source.list():
+            ids = list(id_page)
+            for start in range(0, len(ids), batch_size):
+                fetched = source.fetch(ids=ids[start:start + batch_size]).vectors
+                records = [(vector_id, list(vector.values), dict(vector.metadata or {})) for vector_id, vector in fetched.items()]
+                if records:
+                    target.upsert(vectors=records, namespace=index_name)
+                    copied += len(records)
+
+        if delete_source:
+            self.handles.discard(index_name)
+            self.pc.delete_index(index_name)
+            with self._lock:
+                self._known_indexes.discard(index_name)
+        return copied
+
+
+class LocalBackend:
+    def __init__(self, root=LOCAL_VECTOR_DIR):
+        self.root = root
+        # Loaded indexes hold every row's metadata in memory, so idle users are evicted like Pinecone handles
+        self.handles = HandlePool(lambda index_name: _LocalIndex(index_path(self.root, index_name)))
+
+    def _index(self, index_name):
+        return self.handles.get(index_name)
+
+    def stats(self):
+        return {"backend": "local", "root": self.root, "handles": self.handles.stats()}
+
+    def ensure_index(self, index_name, dimension=1536):
+        self._index(index_name).ensure(dimension)
+
+    def upsert(self, index_name, records):
+        self._index(index_name).upsert(records)
+
+    def query(self, index_name, vector, k):
+        return self._index(index_name).query(vector, k)
+
+    def delete(self, index_name, ids=None, delete_all=False):
+        index = self._index(index_name)
+        if delete_all:
+            index.clear()
+        elif ids:
+            index.delete(ids)
+
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+class _LocalIndex:
+    """
+    One user's vectors. Files in the index directory:
+    meta.json        {"dimension": d}
+    vectors.f32      row-major float32 matrix, rows are unit-normalised so dot product = cosine similarity
+    rows.jsonl       one {"id", "metadata"} line per matrix row; a later row with the same id overwrites an earlier one
+    deleted.jsonl    {"id", "rows"} lines; every row for that id below "rows" is dead
+    ivf.npz          centroids + row assignments of the approximate index, when the corpus is big enough
+    Next to the directory, <index>.lock is flocked exclusively by every write (append, delete, compaction, IVF build) and
+    shared by reads, so appends from two processes can't interleave and a rewrite never happens mid-reload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Outside the directory, clear() removes the directory while holding it
+        self.lock_path = path.rstrip(os.sep) + ".lock"
+        # Shared per path, an evicted handle still finishing a write must not race the fresh one
+        with _path_locks_guard:
+            self._lock = _path_locks.setdefault(path, threading.RLock())
+        self._signature = None
+        self.dimension = None
+        self.ids = []
+        self.metadata = []
+        self.live = np.zeros(0, dtype=bool)
+        self.row_of = {}
+        self.ivf = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def ensure(self, dimension):
+        with self._lock, file_lock(self.lock_path):
+            self._ensure(dimension)
+
+    def _ensure(self, dimension):
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json"), "w") as meta_file:
+                json.dump({"dimension": dimension}, meta_file)
+
+    def _file_signature(self):
+        return tuple(
+            (os.path.getsize(self._file(name)), os.path.getmtime(self._file(name))) if os.path.exists(self._file(name)) else None
+            for name in ("rows.jsonl", "deleted.jsonl", "ivf.npz")
+        )
+
+    def _reload_if_changed(self):
+        # Other uvicorn workers may have written to the same directory, so reload whenever the files changed
+        # (our own writes update the in-memory state and the signature directly, see _append_rows)
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+
+        self.ids, self.metadata, self.row_of = [], [], {}
+        if os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json")) as meta_file:
+                self.dimension = json.load(meta_file)["dimension"]
+        if os.path.exists(self._file("rows.jsonl")):
+            with open(self._file("rows.jsonl"), encoding="utf-8") as rows_file:
+                for line in rows_file:
+                    row = json.loads(line)
+                    self.row_of[row["id"]] = len(self.ids)
+                    self.ids.append(row["id"])
+                    self.metadata.append(row["metadata"])
+
+        self.live = np.zeros(len(self.ids), dtype=bool)
+        self.live[list(self.row_of.values())] = True
+        if os.path.exists(self._file("deleted.jsonl")):
+            with open(self._file("deleted.jsonl"), encoding="utf-8") as deleted_file:
+                for line in deleted_file:
+                    tombstone = json.loads(line)
+                    row = self.row_of.get(tombstone["id"])
+                    if row is not None and row < tombstone["rows"]:
+                        self.live[row] = False
+                        del self.row_of[tombstone["id"]]
+
+        self.ivf = None
+        if os.path.exists(self._file("ivf.npz")):
+            with np.load(self._file("ivf.npz")) as ivf:
+                self.ivf = {"centroids": ivf["centroids"], "assignments": ivf["assignments"]}
+
+    def _matrix(self):
+        if not self.ids:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(len(self.ids), self.dimension))
+
+    def upsert(self, records):
+        if not records:
+            return
+        with self._lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            values = np.asarray([record[1] for record in records], dtype=np.float32)
+            if self.dimension is None:
+                self._ensure(values.shape[1])
+                self.dimension = values.shape[1]
+            norms = np.linalg.norm(values, axis=1, keepdims=True)
+            values = values / np.where(norms == 0, 1, norms)
+
+            # The matrix is written before rows.jsonl, so a reader never sees a row without its vector
+            with open(self._file("vectors.f32"), "ab") as vectors_file:
+                vectors_file.write(values.tobytes())
+            with open(self._file("rows.jsonl"), "a", encoding="utf-8") as rows_file:
+                for vector_id, _, metadata in records:
+                    rows_file.write(json.dumps({"id": vector_id, "metadata": metadata}) + "\n")
+
+            self._append_rows(records)
+            self._maybe_compact()
+            self._maybe_build_ivf()
+
+    def _append_rows(self, records):
+        # Apply our own append in memory, re-reading rows.jsonl after every batch made ingestion quadratic
+        first_row = len(self.ids)
+        self.live = np.concatenate([self.live, np.ones(len(records), dtype=bool)])
+        for offset, (vector_id, _, metadata) in enumerate(records):
+            previous_row = self.row_of.get(vector_id)
+            if previous_row is not None:
+                self.live[previous_row] = False
+            self.row_of[vector_id] = first_row + offset
+            self.ids.append(vector_id)
+            self.metadata.append(metadata)
+        # The exclusive file lock is held, so nobody else wrote since the reload at the top of upsert
+        self._signature = self._file_signature()
+
+    def delete(self, ids):
+        with self._lock, file_lock(self.lock_path):
+            self._reload_if_changed()
+            if not os.path.isdir(self.path):
+                return
+            with open(self._file("deleted.jsonl"), "a", encoding="utf-8") as deleted_file:
+                for vector_id in ids:
+                    deleted_file.write(json.dumps({"id": vector_id, "rows": len(self.ids)}) + "\n")
+            for vector_id in ids:
+                row = self.row_of.pop(vector_id, None)
+                if row is not None:
+                    self.live[row] = False
+            self._signature = self._file_signature()
+            self._maybe_compact()
+
+    def clear(self):
+        with self._lock, file_lock(self.lock_path):
+            dimension = self.dimension
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._signature = None
+            if dimension:
+                self._ensure(dimension)
+            self._reload_if_changed()
+
+    def query(self, vector, k):
+        # The shared file lock covers the reload and mapping the matrix; compaction replaces the files rather than
+        # rewriting them in place, so the mapping stays valid after the lock is released
+        with self._lock, file_lock(self.lock_path, shared=True):
+            self._reload_if_changed()
+            if not self.row_of:
+                return []
+            matrix = self._matrix()
+            ivf = self.ivf
+            ids, metadata, live = self.ids, self.metadata, self.live
+
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+
+        if ivf is None:
+            rows = np.flatnonzero(live)
+        else:
+            # Approximate: only scan the nprobe closest lists, plus rows added since the lists were built
+            built_rows = len(ivf["assignments"])
+            lists = np.argsort(-(ivf["centroids"] @ query))[:LOCAL_ANN_NPROBE]
+            candidates = np.flatnonzero(np.isin(ivf["assignments"], lists))
+            rows = np.concatenate([candidates, np.arange(built_rows, len(ids))])
+            rows = rows[live[rows]]
+
+        scores = matrix[rows] @ query
+        top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"id": ids[rows[i]], "score": float(scores[i]), "metadata": metadata[rows[i]]} for i in top]
+
+    def _maybe_compact(self):
+        # Called with the exclusive file lock held
+        dead = len(self.ids) - len(self.row_of)
+        if not self.ids or dead / len(self.ids) < LOCAL_COMPACT_DEAD_FRACTION:
+            return
+
+        keep = np.flatnonzero(self.live)
+        matrix = np.array(self._matrix()[keep])
+        with open(self._file("vectors.f32.tmp"), "wb") as vectors_file:
+            vectors_file.write(matrix.tobytes())
+        with open(self._file("rows.jsonl.tmp"), "w", encoding="utf-8") as rows_file:
+            for row in keep:
+                rows_file.write(json.dumps({"id": self.ids[row], "metadata": self.metadata[row]}) + "\n")
+        os.replace(self._file("vectors.f32.tmp"), self._file("vectors.f32"))
+        os.replace(self._file("rows.jsonl.tmp"), self._file("rows.jsonl"))
+        for name in ("deleted.jsonl", "ivf.npz"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+        self.ids = [self.ids[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self.row_of = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.ivf = None
+        self._signature = self._file_signature()
+
+    def _maybe_build_ivf(self):
+        # Called with the exclusive file lock held
+        live_count = len(self.row_of)
+        if live_count < LOCAL_ANN_MIN_VECTORS:
+            return
+        if self.ivf is not None and len(self.ids) < len(self.ivf["assignments"]) * (1 + LOCAL_ANN_REBUILD_GROWTH):
+            return
+
+        matrix = self._matrix()
+        centroids = _kmeans(matrix[np.flatnonzero(self.live)], n_lists=int(np.sqrt(live_count)))
+        assignments = np.concatenate([
+            np.argmax(matrix[start:start + 8192] @ centroids.T, axis=1) for start in range(0, len(self.ids), 8192)
+        ])
+        np.savez(self._file("ivf.tmp.npz"), centroids=centroids, assignments=assignments)
+        os.replace(self._file("ivf.tmp.npz"), self._file("ivf.npz"))
+        self.ivf = {"centroids": centroids, "assignments": assignments}
+        self._signature = self._file_signature()
+
+
+def _kmeans(vectors, n_lists, iterations=10, sample_size=20000, seed=0):
+    # Spherical k-means on a sample: centroids are re-normalised so assignment is by cosine similarity
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(len(centroids)):
+            members = sample[assignment == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / (np.linalg.norm(centroid) or 1)
+    return centroids
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = LocalBackend() if VECTOR_STORE == "local" else PineconeBackend()
+    return _vector_store
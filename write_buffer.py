@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+'''
+
+WRITE-BEHIND BUFFER FOR FIRESTORE
+
+Lets a route answer without waiting for its Firestore write.
+'def add' gives the record a client-generated document id (no round trip) and queues it, the id can go straight back to the client
+A background thread commits queued records in Firestore batched writes, as soon as WRITE_BATCH_SIZE records are waiting
+or WRITE_FLUSH_SECONDS after the oldest one was queued, whichever comes first.
+'def stop' flushes whatever is left, so a clean shutdown loses nothing. A crash loses at most the records of one flush interval.
+'def stats' reports queue depth and flush latency.
+'def commit_in_batches' is the synchronous version for bulk routes that need every write committed before they answer
+
+'''
+
+WRITE_BATCH_SIZE = min(int(os.getenv("WRITE_BATCH_SIZE", "200")), 500)  # Firestore caps a batch at 500 writes
+WRITE_FLUSH_SECONDS = float(os.getenv("WRITE_FLUSH_SECONDS", "1"))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", "3"))
+WRITE_RETRY_BACKOFF_SECONDS = float(os.getenv("WRITE_RETRY_BACKOFF_SECONDS", "0.5"))
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        db,
+        batch_size=WRITE_BATCH_SIZE,
+        flush_seconds=WRITE_FLUSH_SECONDS,
+        max_retries=WRITE_MAX_RETRIES,
+        retry_backoff=WRITE_RETRY_BACKOFF_SECONDS,
+        on_commit=None,
+    ):
+        self._db = db  # the Firestore client, or a function returning it (e.g. features.get_db, so the client is built lazily)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_commit = on_commit  # on_commit(collection, data) runs after a record is committed, e.g. cache invalidation
+        self._pending = deque()     # (queued_at, collection, doc_ref, data)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.queued = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def db(self):
+        return self._db() if callable(self._db) else self._db
+
+    def add(self, collection, data):
+        """
+        Queue a new document and return its id straight away.
+        """
+        doc_ref = self.db.collection(collection).document()
+        with self._lock:
+            self._pending.append((time.time(), collection, doc_ref, data))
+            self.queued += 1
+            full = len(self._pending) >= self.batch_size
+        if full or self._thread is None:
+            self._wakeup.set()
+        if self._thread is None:
+            # Not started (e.g. a script without the app's startup hook): write through
+            self.flush()
+        return doc_ref.id
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Anything queued after the thread's last flush
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                oldest = self._pending[0][0] if self._pending else None
+            wait = self.flush_seconds if oldest is None else max(oldest + self.flush_seconds - time.time(), 0)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+            try:
+                self.flush(due_only=not self._stopping.is_set())
+            except Exception:
+                traceback.print_exc()
+        self.flush()
+
+    def flush(self, due_only=False):
+        """
+        Commit queued records in batches. due_only leaves a partial batch whose oldest record isn't due yet.
+        """
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                due = self._pending[0][0] + self.flush_seconds <= time.time()
+                if due_only and not due and len(self._pending) < self.batch_size:
+                    return
+                records = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._commit(records)
+
+    def _commit(self, records):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self.db.batch()
+                for _, _, doc_ref, data in records:
+                    batch.set(doc_ref, data)
+                batch.commit()
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"❌ ERROR: dropping {len(records)} buffered Firestore writes after {attempt + 1} attempts: {str(e)}")
+                    with self._lock:
+                        self.failed += len(records)
+                    return
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.committed += len(records)
+            self.batches += 1
+            self.last_flush_seconds = elapsed
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+        if self.on_commit:
+            for _, collection, _, data in records:
+                try:
+                    self.on_commit(collection, data)
+                except Exception:
+                    traceback.print_exc()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": len(self._pending),
+                "oldest_pending_seconds": time.time() - self._pending[0][0] if self._pending else 0.0,
+                "queued": self.queued,
+                "committed": self.committed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "avg_batch_size": self.committed / self.batches if self.batches else 0.0,
+                "last_flush_seconds": self.last_flush_seconds,
+                "avg_flush_seconds": self.flush_seconds_total / self.batches if self.batches else 0.0,
+                "max_flush_seconds": self.flush_seconds_max,
+                "batch_size": self.batch_size,
+                "flush_interval_seconds": self.flush_seconds,
+            }
+
+
+def commit_in_batches(db, collection, records, batch_size=500):
+    """
+    Write new documents with one batched write per batch_size records, without going through a buffer.
+    Returns each record's document id, or the exception that failed its batch.
+    """
+    results = []
+    for i in range(0, len(records), batch_size):
+        doc_refs = [db.collection(collection).document() for _ in records[i:i + batch_size]]
+        try:
+            batch = db.batch()
+            for doc_ref, data in zip(doc_refs, records[i:i + batch_size]):
+                batch.set(doc_ref, data)
+            batch.commit()
+            results.extend(doc_ref.id for doc_ref in doc_refs)
+        except Exception as e:
+            print(f"❌ ERROR: batched write of {len(doc_refs)} {collection} documents failed: {str(e)}")
+            results.extend(e for _ in doc_refs)
+    return results